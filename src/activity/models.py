@@ -1,21 +1,43 @@
-from sqlalchemy import Column, Integer, String, ForeignKey,DateTime
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, ForeignKey,DateTime,Date,Index,UniqueConstraint
+from sqlalchemy.sql import func, text
 from datetime import datetime
-from database import Base
+from database import Base, Timestamp
 
 class Activity(Base):
    __tablename__="activity"
+   __table_args__=(
+     # a user's stream newest first - each page is one range scan in index order
+     Index("ix_activity_username_timestamp_id","username",text("timestamp DESC"),text("id DESC")),
+     UniqueConstraint("liked_post_id","bucket",name="uq_activity_liked_post_bucket"),
+     # retention walks expired rows oldest first across all users
+     Index("ix_activity_timestamp_id","timestamp","id"),
+   )
    id = Column(Integer,primary_key=True)
    username=Column(String(255),nullable=False)
-   timestamp=Column(DateTime,default=func.now())
+   timestamp=Column(Timestamp,default=func.now())
    liked_post_id=Column(Integer)
    username_liked=Column(String(255))
    liked_post_image=Column(String(255))
    
+   # likes on one post within one time bucket share a row: a running count plus the newest likers.
+   # create_all won't add these columns or the unique key to an existing table - add the columns,
+   # backfill bucket from timestamp, fold each (post, bucket) into its newest row, then add the key
+   bucket=Column(Integer)  # epoch seconds // activity_like_bucket_seconds, null for follows
+   like_count=Column(Integer,default=1,server_default="1")
+   recent_likers=Column(String(255))  # comma separated, newest first
+   
    followed_username=Column(String(255))
    followed_user_pic=Column(String(255))
-   
-   
-   
-   
-   
+
+
+# what expired activity leaves behind - one row per user, day and type with how many events it held
+class ActivityDailySummary(Base):
+   __tablename__="activity_daily"
+   __table_args__=(
+     UniqueConstraint("username","day","type",name="uq_activity_daily_username_day_type"),
+   )
+   id = Column(Integer,primary_key=True)
+   username=Column(String(255),nullable=False)
+   day=Column(Date,nullable=False)
+   type=Column(String(16),nullable=False)
+   count=Column(Integer,nullable=False,default=0,server_default="0")
@@ -0,0 +1,165 @@
+# Activity retention - expired rows are rolled into daily summaries and deleted in small batches
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import bindparam, delete, select
+from typing import Dict, Optional
+from .models import Activity, ActivityDailySummary
+from config import settings
+from database import insert_ignore
+from pagination import keyset_after
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# which rows each TTL applies to - likes are the rows pointing at a post
+ACTIVITY_TYPES = {
+    "like": Activity.liked_post_id.isnot(None),
+    "follow": Activity.liked_post_id.is_(None),
+}
+
+class ActivityRetention:
+    """Deletes activity older than its type's TTL, walking ix_activity_timestamp_id oldest first
+
+    Each batch is one short transaction: the rows are deleted and their counts added to
+    activity_daily together, so an interrupted pass never loses or double counts anything. Every
+    worker runs its own pass, so a batch is only rolled up once its DELETE has removed every row
+    it selected; if another pass got to some of them first, the batch is rolled back and
+    re-selected. The pause between batches leaves the table to request traffic.
+    """
+    def __init__(self, ttl_days: Dict[str, int], batch_size: int = 1000, pause_ms: int = 100, interval_seconds: int = 3600):
+        self.ttl_days = ttl_days
+        self.batch_size = batch_size
+        self.pause = pause_ms / 1000
+        self.interval = interval_seconds
+        self.passes = 0
+        self.batches = 0
+        self.failures = 0
+        self.conflicts = 0  # batches another worker's pass deleted part of first
+        self.deleted = {kind: 0 for kind in ACTIVITY_TYPES}
+        self.summary_rows = 0
+        self.current: Optional[dict] = None  # progress of the pass under way
+        self.last_pass: Optional[dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self, session_factory, now: Optional[datetime] = None) -> Dict[str, int]:
+        """One full pass over every type with a TTL, returning rows deleted per type"""
+        # activity timestamps are naive UTC (func.now() on the database)
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+        started = time.perf_counter()
+        deleted = {}
+        self.current = {"type": None, "cutoff": None, "deleted": 0, "batches": 0}
+        try:
+            for kind, days in self.ttl_days.items():
+                if days <= 0:
+                    continue
+                cutoff = now - timedelta(days=days)
+                self.current.update(type=kind, cutoff=cutoff.isoformat(), deleted=0, batches=0)
+                deleted[kind] = await self._expire(session_factory, kind, cutoff)
+        finally:
+            self.current = None
+        self.passes += 1
+        self.last_pass = {
+            "finished_at": now.isoformat(),
+            "seconds": round(time.perf_counter() - started, 3),
+            "deleted": deleted,
+        }
+        return deleted
+
+    async def _expire(self, session_factory, kind: str, cutoff: datetime) -> int:
+        total = 0
+        after = None  # (timestamp, id) of the last row handled - rows of other types before it are not rescanned
+        while True:
+            async with session_factory() as db:
+                batch = (
+                    select(Activity.id, Activity.username, Activity.timestamp, Activity.like_count)
+                    .where(ACTIVITY_TYPES[kind], Activity.timestamp < cutoff)
+                    .order_by(Activity.timestamp, Activity.id)
+                    .limit(self.batch_size)
+                )
+                if after is not None:
+                    batch = batch.where(keyset_after((Activity.timestamp, Activity.id), after))
+                rows = (await db.execute(batch)).all()
+                if not rows:
+                    return total
+                # the DELETE locks the rows, so once it has removed all of them no other pass can
+                # roll them up too; a short count means one already has
+                removed = await db.execute(delete(Activity).where(Activity.id.in_([row.id for row in rows])))
+                if removed.rowcount != len(rows):
+                    await db.rollback()
+                    self.conflicts += 1
+                    await asyncio.sleep(self.pause)
+                    continue
+                after = (rows[-1].timestamp, rows[-1].id)
+                await self._roll_up(db, kind, rows)
+                await db.commit()
+            total += len(rows)
+            self.deleted[kind] += len(rows)
+            self.batches += 1
+            self.current["deleted"] = total
+            self.current["batches"] += 1
+            if len(rows) < self.batch_size:
+                return total
+            await asyncio.sleep(self.pause)
+
+    async def _roll_up(self, db, kind: str, rows):
+        counts = {}
+        for row in rows:
+            key = (row.username, row.timestamp.date())
+            # a coalesced like row stands for like_count likes
+            counts[key] = counts.get(key, 0) + ((row.like_count or 1) if kind == "like" else 1)
+        table = ActivityDailySummary.__table__
+        # same seed-then-increment shape as the like coalescing, so both dialects take it unchanged
+        await db.execute(insert_ignore(table), [
+            {"username": username, "day": day, "type": kind, "count": 0} for username, day in counts
+        ])
+        await db.execute(
+            table.update()
+            .where(table.c.username == bindparam("b_username"), table.c.day == bindparam("b_day"), table.c.type == kind)
+            .values(count=table.c.count + bindparam("b_count")),
+            [{"b_username": username, "b_day": day, "b_count": count} for (username, day), count in counts.items()],
+        )
+        self.summary_rows += len(counts)
+
+    async def _run(self, session_factory):
+        while True:
+            try:
+                await self.run_once(session_factory)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"activity retention pass failed, retrying next interval: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, session_factory):
+        if self._task is None and any(days > 0 for days in self.ttl_days.values()):
+            self._task = asyncio.create_task(self._run(session_factory))
+
+    async def stop(self):
+        """Stop between batches - whatever was committed stays, the rest waits for the next start"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "ttl_days": self.ttl_days,
+            "passes": self.passes,
+            "batches": self.batches,
+            "deleted": dict(self.deleted),
+            "summary_rows_updated": self.summary_rows,
+            "failures": self.failures,
+            "conflicts": self.conflicts,
+            "in_progress": dict(self.current) if self.current else None,
+            "last_pass": self.last_pass,
+        }
+
+activity_retention = ActivityRetention(
+    {"like": settings.activity_like_ttl_days, "follow": settings.activity_follow_ttl_days},
+    settings.activity_retention_batch_size, settings.activity_retention_pause_ms,
+    settings.activity_retention_interval_seconds,
+)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime 
+from typing import List, Literal, Optional
 
 class ActivityBase(BaseModel):
     username:str
@@ -15,8 +16,17 @@ class Activity(ActivityBase):
     timestamp:datetime
     class Config:
         orm_mode = True
-        
 
-    
-    
-  
\ No newline at end of file
+# one entry of a user's activity stream - only the columns the stream displays
+class ActivityItem(BaseModel):
+    id:int
+    type:Literal["like","follow"]
+    timestamp:datetime
+    liked_post_id:Optional[int]=None
+    username_liked:Optional[str]=None
+    liked_post_image:Optional[str]=None
+    followed_username:Optional[str]=None
+    followed_user_pic:Optional[str]=None
+    like_count:int=1
+    recent_likers:List[str]=[]
+    message:str
@@ -1,9 +1,44 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
 from .models import Activity
+from .schemas import ActivityItem
+from pagination import Page, decode_cursor, keyset_before, page_limit, split_page
 
 
-# get activity by username
-async def get_activity_by_username(db:Session,username:str,page:int=1,limit:int=10)->list[Activity]:
-    offset = (page - 1) * limit
-    return db.query(Activity).filter(Activity.username == username).order_by(Activity.timestamp.desc()).offset(offset).limit(limit).all()
-  
\ No newline at end of file
+ITEM_COLUMNS = (
+    Activity.id, Activity.timestamp, Activity.liked_post_id, Activity.username_liked,
+    Activity.liked_post_image, Activity.followed_username, Activity.followed_user_pic,
+    Activity.like_count, Activity.recent_likers,
+)
+
+def _like_message(latest: str, count: int) -> str:
+    # "alice liked your post" / "alice and 1 other liked your post" / "alice and 4,999 others liked your post"
+    if count <= 1:
+        return f"{latest} liked your post"
+    others = count - 1
+    return f"{latest} and {others:,} other{'s' if others > 1 else ''} liked your post"
+
+def _activity_item(row) -> dict:
+    item = dict(row._mapping)
+    if row.liked_post_id is not None:
+        item["type"] = "like"
+        item["like_count"] = row.like_count or 1
+        item["recent_likers"] = [name for name in (row.recent_likers or "").split(",") if name] or [row.username_liked]
+        item["message"] = _like_message(row.username_liked, item["like_count"])
+    else:
+        item["type"] = "follow"
+        item["recent_likers"] = []
+        item["message"] = f"You followed {row.followed_username}"
+    return item
+
+# get activity by username, newest first - keyset paginated on (timestamp, id), `page` kept for old clients
+async def get_activity_by_username(db:AsyncSession,username:str,page:int=1,limit:int=10,cursor:str=None)->Page[ActivityItem]:
+    limit = page_limit(limit)
+    activities = select(*ITEM_COLUMNS).where(Activity.username == username).order_by(desc(Activity.timestamp), desc(Activity.id))
+    if cursor:
+        activities = activities.where(keyset_before((Activity.timestamp, Activity.id), decode_cursor(cursor, datetime, int)))
+    elif page > 1:
+        activities = activities.offset((page - 1) * limit)
+    rows, next_cursor = split_page((await db.execute(activities.limit(limit + 1))).all(), limit, lambda row: (row.timestamp, row.id))
+    return Page[ActivityItem](items=[_activity_item(row) for row in rows], next_cursor=next_cursor)
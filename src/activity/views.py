@@ -1,19 +1,24 @@
-from fastapi import APIRouter,Depends,status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter,Depends,status,HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
 from .service import get_activity_by_username
 from auth.service import get_current_user
-from auth.schemas import User
+from auth.schemas import UserPrincipal
 from rate_limiter import api_rate_limit
+from pagination import InvalidCursor, Page
+from .schemas import ActivityItem
 
 
 router=APIRouter(prefix="/activity",tags=["activity"])
 
 # get user activity by username
-@router.get("/user")
-async def activity(_: bool = Depends(api_rate_limit), user:User=Depends(get_current_user), page:int=1, limit:int=10, db:Session=Depends(get_db)):
+@router.get("/user",response_model=Page[ActivityItem])
+async def activity(_: bool = Depends(api_rate_limit), user:UserPrincipal=Depends(get_current_user), page:int=1, limit:int=10, cursor:str=None, db:AsyncSession=Depends(get_db)):
     username=user.username
-    return await get_activity_by_username(db,username,page,limit)
+    try:
+        return await get_activity_by_username(db,username,page,limit,cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid cursor")
 
 
   
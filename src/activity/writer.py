@@ -0,0 +1,167 @@
+# Background activity writer - handlers enqueue events, one task bulk-inserts them in batches
+from sqlalchemy import bindparam, func, insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from .models import Activity
+from config import settings
+from database import insert_ignore
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class ActivityWriter:
+    """asyncio.Queue of Activity rows, flushed with executemany once batch_size rows or interval_ms accumulate"""
+    def __init__(self, max_queue: int = 10000, batch_size: int = 500, interval_ms: int = 200, enqueue_timeout_ms: int = 1000):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self.queue: Optional[asyncio.Queue] = None
+        self.session_factory = None
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.failed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self, session_factory):
+        if self._task is None:
+            self.session_factory = session_factory
+            self.queue = asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Write everything already queued, then stop the background task"""
+        if self._task is None:
+            return
+        await self.queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def enqueue(self, values: dict):
+        # a full queue makes the handler wait (backpressure); past the timeout the event is dropped
+        # rather than holding the request open while the database is unavailable
+        try:
+            await asyncio.wait_for(self.queue.put(values), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            logger.warning("activity queue full, dropped one event")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self.queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = loop.time() + self.interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                try:
+                    item = self.queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self.queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+
+    async def _write(self, batch: list):
+        try:
+            async with self.session_factory() as db:
+                await write_activity(db, batch)
+                await db.commit()
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"activity batch of {len(batch)} failed: {e}")
+            return
+        self.written += len(batch)
+        self.batches += 1
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self.queue.qsize() if self.queue else 0,
+            "max_queue": self.max_queue,
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+async def write_activity(db: AsyncSession, events: list):
+    """Insert a batch of activity events, folding likes into their post's aggregate row for the bucket"""
+    likes = [event for event in events if event.get("liked_post_id") is not None]
+    others = [event for event in events if event.get("liked_post_id") is None]
+    if others:
+        await db.execute(insert(Activity), others)
+    if likes:
+        await _coalesce_likes(db, likes)
+
+async def _coalesce_likes(db: AsyncSession, likes: list):
+    table = Activity.__table__
+    groups = {}
+    for event in likes:
+        group = groups.setdefault((event["liked_post_id"], event["bucket"]), {**event, "likers": []})
+        group["likers"].insert(0, event["username_liked"])
+    # one row per (post, bucket) - insert-or-ignore so concurrent writers meet on the unique key
+    await db.execute(insert_ignore(table), [
+        {**{k: v for k, v in group.items() if k != "likers"}, "like_count": 0, "recent_likers": ""}
+        for group in groups.values()
+    ])
+    current = dict(
+        ((row.liked_post_id, row.bucket), row.recent_likers)
+        for row in await db.execute(
+            select(table.c.liked_post_id, table.c.bucket, table.c.recent_likers)
+            .where(tuple_(table.c.liked_post_id, table.c.bucket).in_(list(groups)))
+        )
+    )
+    updates = []
+    for key, group in groups.items():
+        known = [name for name in (current.get(key) or "").split(",") if name]
+        newest = list(dict.fromkeys(group["likers"] + known))[:settings.activity_recent_likers]
+        updates.append({
+            "b_post": key[0], "b_bucket": key[1], "b_count": len(group["likers"]),
+            "b_likers": ",".join(newest), "b_last": group["likers"][0],
+        })
+    # the count is added in SQL so it stays exact even if another writer touched the row meanwhile
+    await db.execute(
+        table.update()
+        .where(table.c.liked_post_id == bindparam("b_post"), table.c.bucket == bindparam("b_bucket"))
+        .values(
+            like_count=table.c.like_count + bindparam("b_count"),
+            recent_likers=bindparam("b_likers"),
+            username_liked=bindparam("b_last"),
+            timestamp=func.now(),
+        ),
+        updates,
+    )
+
+async def record_activity(db: AsyncSession, **values):
+    """Record an activity event after the caller's own write has committed
+
+    Goes through the background writer when the app started it; scripts and tests without a
+    running writer get the row written straight away on the caller's session.
+    """
+    if values.get("liked_post_id") is not None:
+        values["bucket"] = int(time.time() // settings.activity_like_bucket_seconds)
+    if activity_writer.running:
+        await activity_writer.enqueue(values)
+        return
+    await write_activity(db, [values])
+    await db.commit()
+
+activity_writer = ActivityWriter(
+    settings.activity_queue_size, settings.activity_batch_size,
+    settings.activity_flush_interval_ms, settings.activity_enqueue_timeout_ms,
+)
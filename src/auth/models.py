@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Date, Enum, ForeignKey, Index
 from sqlalchemy.sql import func
 from database import Base
 from .enums import Gender
@@ -7,6 +7,10 @@ from post.models import Post
 
 class Follow(Base):
   __tablename__ = "follow"
+  __table_args__ = (
+    # the primary key serves "who do I follow", this serves "who follows me"
+    Index("ix_follow_following_follower","following_id","follower_id"),
+  )
   follower_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
   following_id = Column(Integer, ForeignKey("user.id"), primary_key=True)
   
@@ -76,5 +76,16 @@ class User(UserBase):
   
   class Config:
     from_attributes = True
-    
-  
+
+
+# lightweight identity resolved from the bearer token - cached per user id
+class UserPrincipal(BaseModel):
+  id:int
+  username:str
+  name:Optional[str]=None
+  profile_pic:Optional[str]=None
+  followers_count:Optional[int]=0
+  following_count:Optional[int]=0
+
+  class Config:
+    from_attributes = True
@@ -1,9 +1,10 @@
 from fastapi import Depends
 
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta,datetime
 from .models import User
-from .schemas import UserCreate,UserUpdate
+from .schemas import UserCreate,UserUpdate,UserPrincipal
 
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
@@ -12,12 +13,23 @@ from database import get_db
 from config import settings
 from logger import log_security_event
 from security_utils import account_protection, sanitizer
+from password_pool import PasswordHashPool
+from cache import LRUCache
+import hashlib
 
 bcyrpt_context=CryptContext(schemes=["bcrypt"],deprecated="auto")
+# bcrypt is CPU heavy - run it on a bounded pool so it never blocks the event loop
+password_pool=PasswordHashPool(bcyrpt_context,settings.password_pool_workers,settings.password_pool_max_queue)
 oauth2_bearer=OAuth2PasswordBearer(tokenUrl="/v1/auth/login")
+# same scheme for endpoints that work anonymously but personalise the response when logged in
+optional_oauth2_bearer=OAuth2PasswordBearer(tokenUrl="/v1/auth/login",auto_error=False)
+# verified JWT claims keyed by sha256(token); each entry expires at the token's own exp
+token_cache=LRUCache(maxsize=settings.token_cache_size)
+# UserPrincipal keyed by user id - dropped on profile updates and follower count changes
+user_cache=LRUCache(maxsize=settings.user_cache_size,ttl=settings.user_cache_ttl)
 
 #exixting user check with proper SQL injection protection
-async def existing_user(db:Session,username:str,email:str):
+async def existing_user(db:AsyncSession,username:str,email:str):
     # Sanitize inputs to prevent SQL injection
     username = username.strip() if username else ""
     email = email.strip() if email else ""
@@ -27,9 +39,9 @@ async def existing_user(db:Session,username:str,email:str):
     db_user_email = None
     
     if username:
-        db_user_username=db.query(User).filter(User.username==username).first()
+        db_user_username=await db.scalar(select(User).where(User.username==username))
     if email:
-        db_user_email=db.query(User).filter(User.email==email).first()
+        db_user_email=await db.scalar(select(User).where(User.email==email))
     
     return db_user_username or db_user_email
 
@@ -40,10 +52,37 @@ async def create_access_token(username:str, id:int):
     encode.update({"exp":expires})
     return jwt.encode(encode,settings.secret_key,algorithm=settings.algorithm)
   
+#decode token - repeat requests with the same bearer token skip signature verification
+def decode_access_token(token:str)->dict:
+    key=hashlib.sha256(token.encode()).digest()
+    payload=token_cache.get(key)
+    if payload is None:
+      payload=jwt.decode(token,settings.secret_key,algorithms=[settings.algorithm])
+      if payload.get("exp"):
+        token_cache.set(key,payload,expires_at=payload["exp"])
+    return payload
+
+#load the lightweight principal for a user id, served from user_cache when possible
+async def get_user_principal(db:AsyncSession, user_id:int):
+    principal=user_cache.get(user_id)
+    if principal is None:
+      row=(await db.execute(select(
+        User.id,User.username,User.name,User.profile_pic,User.followers_count,User.following_count
+      ).where(User.id==user_id))).first()
+      if not row:
+        return None
+      principal=UserPrincipal.model_validate(row)
+      user_cache.set(user_id,principal)
+    return principal
+
+def invalidate_user_cache(*user_ids:int):
+    for user_id in user_ids:
+      user_cache.pop(user_id)
+
 #get user from token
-async def get_current_user(db:Session=Depends(get_db), token:str=Depends(oauth2_bearer)):
+async def get_current_user(db:AsyncSession=Depends(get_db), token:str=Depends(oauth2_bearer)):
     try:
-      payload=jwt.decode(token,settings.secret_key,algorithms=[settings.algorithm])
+      payload=decode_access_token(token)
       username:str=payload.get("sub")
       id:int=payload.get("id")
       expires:datetime=payload.get("exp")
@@ -53,7 +92,7 @@ async def get_current_user(db:Session=Depends(get_db), token:str=Depends(oauth2_
       if username is None or id is None:
         log_security_event("invalid_token", {"reason": "Missing username or id"})
         return None
-      user = db.query(User).filter(User.id==id).first()
+      user = await get_user_principal(db,id)
       if not user:
         log_security_event("user_not_found", {"username": username, "user_id": id})
       return user
@@ -61,12 +100,18 @@ async def get_current_user(db:Session=Depends(get_db), token:str=Depends(oauth2_
       log_security_event("invalid_token", {"reason": str(e)})
       return None
 
+# user from token when one is sent, None for anonymous requests
+async def get_optional_user(db:AsyncSession=Depends(get_db), token:str=Depends(optional_oauth2_bearer)):
+    if not token:
+      return None
+    return await get_current_user(db,token)
+
 #get user from user_id
-async def get_user_from_id(db:Session, user_id:int):
-    return db.query(User).filter(User.id==user_id).first()
+async def get_user_from_id(db:AsyncSession, user_id:int):
+    return await db.scalar(select(User).where(User.id==user_id))
 
 #create new user
-async def create_user(db:Session, user:UserCreate):
+async def create_user(db:AsyncSession, user:UserCreate):
   # Additional sanitization at service layer (defense in depth)
   sanitized_email = sanitizer.sanitize_html(user.email.lower().strip())
   sanitized_username = sanitizer.sanitize_html(user.username.lower().strip())
@@ -78,7 +123,7 @@ async def create_user(db:Session, user:UserCreate):
   db_user=User(
     email=sanitized_email,
     username=sanitized_username,
-    hashed_password=bcyrpt_context.hash(user.hashed_password),
+    hashed_password=await password_pool.hash(user.hashed_password),
     dob=user.dob or None,
     gender=user.gender or None,
     bio=sanitized_bio,
@@ -87,14 +132,14 @@ async def create_user(db:Session, user:UserCreate):
     name=sanitized_name
   )
   db.add(db_user)
-  db.commit()
-  db.refresh(db_user)
+  await db.commit()
+  await db.refresh(db_user)
   return db_user
   
   
   
 #auth - Authenticate user with account lockout protection and SQL injection prevention
-async def authenticate(db:Session, username:str, password:str, client_ip: str = None):   
+async def authenticate(db:AsyncSession, username:str, password:str, client_ip: str = None):   
     # Input validation and sanitization for SQL injection prevention
     if not username or not password:
         log_security_event("login_failed", {
@@ -147,7 +192,7 @@ async def authenticate(db:Session, username:str, password:str, client_ip: str =
         })
         return {"locked": False, "user": None}
     
-    if not bcyrpt_context.verify(password, db_user.hashed_password):
+    if not await password_pool.verify(password, db_user.hashed_password):
         # Record failed attempt
         should_lock = account_protection.record_failed_attempt(username)
         log_security_event("login_failed", {
@@ -169,7 +214,7 @@ async def authenticate(db:Session, username:str, password:str, client_ip: str =
     return {"locked": False, "user": db_user}
 
 #update user
-async def update_user(db:Session, db_user:User, user:UserUpdate):
+async def update_user(db:AsyncSession, db_user:User, user:UserUpdate):
     # Additional sanitization at service layer (defense in depth)
     db_user.name = sanitizer.sanitize_html(user.name) if user.name else None
     db_user.dob = user.dob
@@ -177,7 +222,8 @@ async def update_user(db:Session, db_user:User, user:UserUpdate):
     db_user.bio = sanitizer.sanitize_html(user.bio) if user.bio else None
     db_user.location = sanitizer.sanitize_html(user.location) if user.location else None
     db_user.profile_pic = sanitizer.sanitize_html(user.profile_pic) if user.profile_pic else None
-    db.commit()
+    await db.commit()
+    invalidate_user_cache(db_user.id)
 
 
 
@@ -1,11 +1,12 @@
 from cmath import log
 from fastapi import APIRouter, Depends,status,HTTPException,Request
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from .schemas import UserCreate, UserUpdate, User
+from .schemas import UserCreate, UserUpdate, User, UserPrincipal
 from database import get_db
 from .service import existing_user, create_access_token, get_current_user, get_user_from_id,authenticate,create_user as create_user_svc,update_user as update_user_svc
+from password_pool import PasswordPoolSaturated
 from logger import log_auth_success, log_auth_failed, log_error, log_user_action, log_unauthorized_access, get_client_ip, get_user_agent
 from rate_limiter import auth_rate_limit, general_rate_limit
 
@@ -13,7 +14,7 @@ router =APIRouter(prefix="/auth",tags=["auth"])
 
 #signup
 @router.post("/register",status_code=status.HTTP_201_CREATED)
-async def create_user(request:Request,user:UserCreate, _: bool = Depends(auth_rate_limit), db:Session=Depends(get_db)):
+async def create_user(request:Request,user:UserCreate, _: bool = Depends(auth_rate_limit), db:AsyncSession=Depends(get_db)):
   #only 5 requests per minute for auth endpoints
   client_ip = get_client_ip(request)
   user_agent = get_user_agent(request)
@@ -32,13 +33,18 @@ async def create_user(request:Request,user:UserCreate, _: bool = Depends(auth_ra
 
   except HTTPException:
       raise  # Re-raise HTTP exceptions as-is
+  except PasswordPoolSaturated as e:
+      log_error(f"SIGNUP:{user.username}", str(e), "/auth/register", client_ip)
+      raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail="Server busy, please retry shortly",
+                        headers={"Retry-After": "1"})
   except Exception as e:
       log_error(f"SIGNUP:{user.username}", str(e), "/auth/register", client_ip)
       raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                         detail="Internal Server Error")
 #login
 @router.post("/login", status_code = status.HTTP_200_OK)
-async def login(request: Request, _: bool = Depends(auth_rate_limit), form_data : OAuth2PasswordRequestForm=Depends(), db:Session=Depends(get_db)):
+async def login(request: Request, _: bool = Depends(auth_rate_limit), form_data : OAuth2PasswordRequestForm=Depends(), db:AsyncSession=Depends(get_db)):
   #for logging
   client_ip = get_client_ip(request)
   user_agent = get_user_agent(request)
@@ -69,6 +75,13 @@ async def login(request: Request, _: bool = Depends(auth_rate_limit), form_data
       return {"access_token":access_token,"token_type":"bearer"}
   except HTTPException:
       raise  # Re-raise HTTP exceptions as-is
+  except PasswordPoolSaturated as e:
+      log_error(f"Login rejected for {username}", str(e), "/auth/login", client_ip)
+      raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server busy, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
   except Exception as e:
       log_error(f"Login error for {username}", str(e), "/auth/login", client_ip)
       raise HTTPException(
@@ -77,8 +90,9 @@ async def login(request: Request, _: bool = Depends(auth_rate_limit), form_data
         )
 #current_user -->replaced the feature of passing tokens as parameters with dependency injection
 @router.get("/profile",status_code=status.HTTP_200_OK,response_model=User)
-async def current_user(request: Request, _: bool = Depends(general_rate_limit), db_user:User=Depends(get_current_user), db:Session=Depends(get_db)):
-  # db_user=await get_current_user(db,token)
+async def current_user(request: Request, _: bool = Depends(general_rate_limit), principal:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
+  # the principal only carries identity fields - load the full row for the profile response
+  db_user=await get_user_from_id(db,principal.id) if principal else None
   if not db_user:
     client_ip = get_client_ip(request)
     user_agent = get_user_agent(request)
@@ -90,9 +104,14 @@ async def current_user(request: Request, _: bool = Depends(general_rate_limit),
 #update_user --> replaced the feature of passing tokens as parameters with dependency injection
 
 @router.put("/profile",status_code=status.HTTP_204_NO_CONTENT)
-async def update_user(request:Request,user_update:UserUpdate, _: bool = Depends(general_rate_limit), db_user:User=Depends(get_current_user), db:Session=Depends(get_db)):
+async def update_user(request:Request,user_update:UserUpdate, _: bool = Depends(general_rate_limit), principal:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
   client_ip = get_client_ip(request)
   user_agent = get_user_agent(request)
+  db_user=await get_user_from_id(db,principal.id) if principal else None
+  if not db_user:
+    log_unauthorized_access(client_ip, "/auth/profile", "invalid or expired token", user_agent)
+    raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Invalid or expired token")
   try:
       log_user_action(db_user.username, "profile_update", "profile updated successfully", user_agent)
       return await update_user_svc(db,db_user,user_update)
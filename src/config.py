@@ -9,12 +9,77 @@ class Settings:
        self.secret_key=self.get_required_env("SECRET_KEY")
        self.algorithm=self.get_required_env("ALGORITHM",default="HS256")
        self.token_expiration_minutes=self.get_int_env("TOKEN_EXPIRATION_MINUTES",default=30)
+       self.token_cache_size=self.get_int_env("TOKEN_CACHE_SIZE",default=10000)
+       self.user_cache_size=self.get_int_env("USER_CACHE_SIZE",default=10000)
+       self.user_cache_ttl=self.get_int_env("USER_CACHE_TTL",default=60)  # seconds
        
        # database
        self.database_url=self.get_required_env("DATABASE_URL")
+       self.async_database_url=self.get_required_env("ASYNC_DATABASE_URL",default=self.to_async_url(self.database_url))
+       self.db_echo=self.get_bool_env("DB_ECHO",default=False)
+       self.db_pool_size=self.get_int_env("DB_POOL_SIZE",default=5)
+       self.db_max_overflow=self.get_int_env("DB_MAX_OVERFLOW",default=10)
+       self.db_pool_pre_ping=self.get_bool_env("DB_POOL_PRE_PING",default=True)
+       self.db_pool_recycle=self.get_int_env("DB_POOL_RECYCLE",default=1800)  # seconds, -1 disables
+       self.db_pool_timeout=self.get_int_env("DB_POOL_TIMEOUT",default=30)  # seconds to wait for a free connection
+       
+       # follow graph - keep every follow edge in memory for O(log n) relationship checks
+       self.follow_graph_index=self.get_bool_env("FOLLOW_GRAPH_INDEX",default=False)
+       
+       # suggestions - friends-of-friends walks at most max_friends * max_per_friend edges per request
+       self.suggestions_max_friends=self.get_int_env("SUGGESTIONS_MAX_FRIENDS",default=200)
+       self.suggestions_max_per_friend=self.get_int_env("SUGGESTIONS_MAX_PER_FRIEND",default=200)
+       self.suggestions_max_results=self.get_int_env("SUGGESTIONS_MAX_RESULTS",default=50)
+       self.suggestions_cache_size=self.get_int_env("SUGGESTIONS_CACHE_SIZE",default=10000)
+       self.suggestions_cache_ttl=self.get_int_env("SUGGESTIONS_CACHE_TTL",default=300)  # seconds
+       self.relationships_max_usernames=self.get_int_env("RELATIONSHIPS_MAX_USERNAMES",default=500)  # per bulk status request
+       
+       # activity - written in the background in batches of up to activity_batch_size rows
+       self.activity_queue_size=self.get_int_env("ACTIVITY_QUEUE_SIZE",default=10000)
+       self.activity_batch_size=self.get_int_env("ACTIVITY_BATCH_SIZE",default=500)
+       self.activity_flush_interval_ms=self.get_int_env("ACTIVITY_FLUSH_INTERVAL_MS",default=200)
+       self.activity_enqueue_timeout_ms=self.get_int_env("ACTIVITY_ENQUEUE_TIMEOUT_MS",default=1000)  # wait on a full queue before dropping
+       self.activity_like_bucket_seconds=self.get_int_env("ACTIVITY_LIKE_BUCKET_SECONDS",default=3600)  # likes on a post coalesce per bucket
+       self.activity_recent_likers=self.get_int_env("ACTIVITY_RECENT_LIKERS",default=3)
+       # retention - activity older than its type's TTL is rolled into activity_daily and deleted (0 keeps forever)
+       self.activity_like_ttl_days=self.get_int_env("ACTIVITY_LIKE_TTL_DAYS",default=90)
+       self.activity_follow_ttl_days=self.get_int_env("ACTIVITY_FOLLOW_TTL_DAYS",default=365)
+       self.activity_retention_batch_size=self.get_int_env("ACTIVITY_RETENTION_BATCH_SIZE",default=1000)
+       self.activity_retention_pause_ms=self.get_int_env("ACTIVITY_RETENTION_PAUSE_MS",default=100)  # between delete batches
+       self.activity_retention_interval_seconds=self.get_int_env("ACTIVITY_RETENTION_INTERVAL_SECONDS",default=3600)
+       
+       # pagination
+       self.max_page_size=self.get_int_env("MAX_PAGE_SIZE",default=100)
+       
+       # home timeline
+       self.timeline_max_length=self.get_int_env("TIMELINE_MAX_LENGTH",default=800)
+       self.timeline_trim_every=self.get_int_env("TIMELINE_TRIM_EVERY",default=50)  # trim each reader on ~1 in N fan-outs
+       # authors at or above this many followers are not fanned out - their posts are merged in at read time
+       self.celebrity_follower_threshold=self.get_int_env("CELEBRITY_FOLLOWER_THRESHOLD",default=10000)
+       self.recent_posts_per_author=self.get_int_env("RECENT_POSTS_PER_AUTHOR",default=100)
+       self.recent_posts_ttl=self.get_int_env("RECENT_POSTS_TTL",default=30)  # seconds, bounds staleness across workers
+       
+       # hashtags
+       self.hashtag_cache_size=self.get_int_env("HASHTAG_CACHE_SIZE",default=10000)  # hashtag name -> id entries
+       self.trending_capacity=self.get_int_env("TRENDING_CAPACITY",default=1000)  # counters per time bucket
+       self.trending_refresh_seconds=self.get_int_env("TRENDING_REFRESH_SECONDS",default=5)
+       self.trending_max_results=self.get_int_env("TRENDING_MAX_RESULTS",default=50)
+       
+       # likes - write-behind batches likes_count updates instead of updating the row on every like
+       self.like_write_behind=self.get_bool_env("LIKE_WRITE_BEHIND",default=False)
+       self.like_flush_interval_ms=self.get_int_env("LIKE_FLUSH_INTERVAL_MS",default=250)
        
        #security
        self.allowed_origins=self.get_list_env("ALLOWED_ORIGINS",default=["http://localhost:8000"])
+       self.password_pool_workers=self.get_int_env("PASSWORD_POOL_WORKERS",default=4)
+       self.password_pool_max_queue=self.get_int_env("PASSWORD_POOL_MAX_QUEUE",default=32)  # waiting hash/verify calls before rejecting
+       # /metrics is only served to these peer addresses or CIDR ranges (the direct connection, never a forwarded header)
+       self.metrics_allowed_hosts=self.get_list_env("METRICS_ALLOWED_HOSTS",default=["127.0.0.1","::1"])
+       # rate limiting - X-Forwarded-For / X-Real-IP are only believed from these addresses or CIDR ranges
+       self.trusted_proxies=self.get_list_env("TRUSTED_PROXIES",default=[])
+       self.rate_limit_max_clients=self.get_int_env("RATE_LIMIT_MAX_CLIENTS",default=100000)  # exact buckets per tier, 0 for unbounded
+       self.rate_limit_sketch_width=self.get_int_env("RATE_LIMIT_SKETCH_WIDTH",default=4096)  # count-min counters per row beyond the cap
+       self.rate_limit_sketch_depth=self.get_int_env("RATE_LIMIT_SKETCH_DEPTH",default=4)
        
     def get_required_env(self,key:str,default=None):
         value = os.getenv(key,default)
@@ -33,6 +98,30 @@ class Settings:
         except ValueError:
             raise ValueError(f"{key} environment variable must be an integer")
 
+    def get_bool_env(self,key:str,default:bool=False):
+        value = os.getenv(key)
+        if value is None:
+            return default
+        if value.strip().lower() in ("1","true","yes","on"):
+            return True
+        if value.strip().lower() in ("0","false","no","off"):
+            return False
+        raise ValueError(f"{key} environment variable must be a boolean")
+
+    def to_async_url(self,url:str):
+        # swap the sync DBAPI driver for its asyncio counterpart (sqlite -> aiosqlite, mysql -> aiomysql)
+        async_drivers = {
+            "sqlite": "sqlite+aiosqlite",
+            "mysql": "mysql+aiomysql",
+            "mysql+pymysql": "mysql+aiomysql",
+            "postgresql": "postgresql+asyncpg",
+            "postgresql+psycopg2": "postgresql+asyncpg",
+        }
+        scheme, sep, rest = url.partition("://")
+        if not sep:
+            return url
+        return f"{async_drivers.get(scheme, scheme)}://{rest}"
+
     def get_list_env(self,key:str,default=None):
         value = os.getenv(key)  # Don't pass default here
         if value is None:
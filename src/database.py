@@ -1,19 +1,128 @@
-from sqlalchemy import create_engine
+from sqlalchemy import DateTime, create_engine, insert
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from config import settings
-import os
+import threading
+import time
 
-Engine = create_engine(settings.database_url, echo=True)
+class PoolStats:
+    """Checkout wait times for one connection pool"""
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+        self._lock = threading.Lock()
 
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += seconds
+            self.last_wait = seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "last_wait_ms": round(self.last_wait * 1000, 3),
+            }
+
+class InstrumentedPoolMixin:
+    """Times how long each checkout waits for a free connection"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except Exception:
+            self.stats.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.stats.record_wait(time.perf_counter() - start)
+        return conn
+
+class InstrumentedQueuePool(InstrumentedPoolMixin, QueuePool):
+    pass
+
+class InstrumentedAsyncQueuePool(InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+def engine_options(url: str, poolclass) -> dict:
+    options = {"echo": settings.db_echo, "pool_pre_ping": settings.db_pool_pre_ping}
+    parsed = make_url(url)
+    # in-memory sqlite lives inside a single connection, so it keeps sqlalchemy's default pool
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return options
+    options.update(
+        poolclass=poolclass,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle,
+        pool_timeout=settings.db_pool_timeout,
+    )
+    return options
+
+# sync engine - kept for scripts and benchmarks that still run blocking queries
+Engine = create_engine(settings.database_url, **engine_options(settings.database_url, InstrumentedQueuePool))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=Engine)
-Base=declarative_base()
 
-def get_db():
-  db=SessionLocal()
-  try:
+# async engine - used by every request handler so queries never block the event loop
+AsyncEngine = create_async_engine(settings.async_database_url, **engine_options(settings.async_database_url, InstrumentedAsyncQueuePool))
+AsyncSessionLocal = async_sessionmaker(bind=AsyncEngine, autoflush=False, expire_on_commit=False)
+
+# sqlite writes func.now() as 'YYYY-MM-DD HH:MM:SS' but bound datetimes with microseconds, which breaks
+# keyset comparisons on equal timestamps - store both the same way for columns used in cursors
+Timestamp = DateTime().with_variant(
+    SQLITE_DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
+def insert_ignore(table):
+    """INSERT that silently skips rows hitting a unique key, so concurrent writers can race safely"""
+    return insert(table).prefix_with("OR IGNORE", dialect="sqlite").prefix_with("IGNORE", dialect="mysql")
+
+# AsyncAttrs gives every model `await obj.awaitable_attrs.<relationship>` for lazy relationships
+Base=declarative_base(cls=AsyncAttrs)
+
+async def get_db():
+  async with AsyncSessionLocal() as db:
     yield db
-  finally:
-    db.close()
-    
-    
+
+def pool_status(pool) -> dict:
+    """Live view of a pool: checked-out / idle / overflow connections plus checkout waits"""
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__, "status": pool.status()}
+    status = {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+        "timeout_seconds": pool.timeout(),
+    }
+    if isinstance(pool, InstrumentedPoolMixin):
+        status.update(pool.stats.snapshot())
+    return status
+
+def get_pool_stats() -> dict:
+    return {
+        "async": pool_status(AsyncEngine.sync_engine.pool),
+        "sync": pool_status(Engine.pool),
+    }
+
+
@@ -1,20 +1,41 @@
-from fastapi import FastAPI,APIRouter,Request, Depends
+from fastapi import FastAPI,APIRouter,Request, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from database import Base, Engine
+from database import Base, AsyncEngine, AsyncSessionLocal, get_pool_stats
 from api import router
 from config import settings
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
-from rate_limiter import general_rate_limit
+import ipaddress
+from rate_limiter import general_rate_limit, api_rate_limit, rate_limiter
+from auth.service import password_pool, token_cache, user_cache
+from post.service import trending_hashtags, like_counters
+from profile.graph import follow_graph
+from activity.writer import activity_writer
+from activity.retention import activity_retention
 
 @asynccontextmanager
 async def lifespan(app:FastAPI):
     print("Starting FastAPI application")
     # Create database tables
-    Base.metadata.create_all(bind=Engine)
+    async with AsyncEngine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
     print("Database tables created successfully")
+    if settings.follow_graph_index:
+        async with AsyncSessionLocal() as db:
+            await follow_graph.load(db)
+        print(f"Follow graph loaded: {follow_graph.edges} edges")
+    activity_writer.start(AsyncSessionLocal)
+    activity_retention.start(AsyncSessionLocal)
+    if settings.like_write_behind:
+        like_counters.start(AsyncSessionLocal)
     yield
     print("Shutting down FastAPI application")
+    # drain buffered activity and like counts before the engine goes away
+    await activity_retention.stop()
+    await activity_writer.stop()
+    await like_counters.stop(AsyncSessionLocal)
+    password_pool.shutdown()
+    await AsyncEngine.dispose()
     
 
 app=FastAPI(
@@ -65,3 +86,33 @@ app.include_router(router)
 async def root(request: Request, _: bool = Depends(general_rate_limit)):
     """Root endpoint with rate limiting for DDoS protection"""
     return {"message": "Social Media API", "version": "1.0", "status": "active"}
+
+# internal endpoints answer only peers on the metrics allowlist - proxies and forwarded headers don't count
+metrics_networks=[ipaddress.ip_network(host,strict=False) for host in settings.metrics_allowed_hosts]
+
+async def internal_only(request: Request):
+    host = request.client.host if request.client else None
+    try:
+        allowed = host is not None and any(ipaddress.ip_address(host) in network for network in metrics_networks)
+    except ValueError:
+        allowed = False
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return True
+
+# Runtime metrics - connection pool usage, password hashing timings and cache hit rates
+@app.get("/metrics")
+async def metrics(_: bool = Depends(internal_only), __: bool = Depends(api_rate_limit)):
+    """Live process metrics"""
+    return {
+        "db_pool": get_pool_stats(),
+        "password_hashing": password_pool.stats(),
+        "token_cache": token_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "trending_hashtags": trending_hashtags.stats(),
+        "like_counters": like_counters.stats(),
+        "follow_graph": follow_graph.stats(),
+        "activity_writer": activity_writer.stats(),
+        "activity_retention": activity_retention.stats(),
+        "rate_limiter": rate_limiter.stats(),
+    }
@@ -0,0 +1,67 @@
+# Keyset (cursor) pagination helpers - cursors are opaque base64 encoded sort keys
+from datetime import datetime
+from pydantic import BaseModel
+from sqlalchemy import and_, or_
+from typing import Callable, Generic, List, Optional, TypeVar
+from config import settings
+import base64
+import json
+
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    """Response envelope shared by every list endpoint - pass next_cursor back to get the following page"""
+    items: List[T] = []
+    next_cursor: Optional[str] = None
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue"""
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, *types) -> tuple:
+    """Decode a cursor back into its sort key, converting each value to the matching type"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(types):
+            raise InvalidCursor("malformed cursor")
+        return tuple(
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for kind, value in zip(types, values)
+        )
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("malformed cursor") from e
+
+def keyset_before(columns, values):
+    """WHERE clause selecting rows that sort after `values` under ORDER BY columns DESC"""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column < values[i]))
+    return or_(*clauses)
+
+def keyset_after(columns, values):
+    """WHERE clause selecting rows that sort after `values` under ORDER BY columns ASC"""
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        clauses.append(and_(*equal, column > values[i]))
+    return or_(*clauses)
+
+def page_limit(limit: Optional[int]) -> int:
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE"""
+    return min(max(limit or 1, 1), settings.max_page_size)
+
+def split_page(rows: list, limit: int, sort_key: Callable) -> tuple:
+    """Drop the extra row fetched with LIMIT limit+1, returning (rows, next_cursor)
+
+    The extra row tells us whether another page exists without a COUNT(*); the cursor is
+    sort_key() of the last row that is kept.
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*sort_key(rows[-1]))
@@ -0,0 +1,85 @@
+# Runs bcrypt hashing/verification off the event loop on a size-bounded thread pool
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+import asyncio
+import threading
+import time
+
+class PasswordPoolSaturated(Exception):
+    """Raised when every worker is busy and the wait queue is full"""
+
+class OperationStats:
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+        self.total_queue_wait = 0.0
+
+    def record(self, queue_wait: float, run_time: float):
+        self.calls += 1
+        self.total_time += run_time
+        self.last_time = run_time
+        self.max_time = max(self.max_time, run_time)
+        self.total_queue_wait += queue_wait
+
+    def snapshot(self) -> dict:
+        return {
+            "calls": self.calls,
+            "avg_ms": round(self.total_time / self.calls * 1000, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_time * 1000, 3),
+            "last_ms": round(self.last_time * 1000, 3),
+            "avg_queue_wait_ms": round(self.total_queue_wait / self.calls * 1000, 3) if self.calls else 0.0,
+        }
+
+class PasswordHashPool:
+    def __init__(self, context, max_workers: int = 4, max_queue: int = 32):
+        self.context = context  # passlib CryptContext
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password")
+        self.in_flight = 0  # running + queued, only touched from the event loop
+        self.rejected = 0
+        self.operations: Dict[str, OperationStats] = {"hash": OperationStats(), "verify": OperationStats()}
+        self._lock = threading.Lock()
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run("verify", self.context.verify, password, hashed)
+
+    async def _run(self, operation: str, func, *args):
+        # reject straight away instead of letting logins pile up behind a busy pool
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise PasswordPoolSaturated(f"password {operation} pool is saturated")
+        self.in_flight += 1
+        submitted = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, self._timed, operation, submitted, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    def _timed(self, operation: str, submitted: float, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.operations[operation].record(started - submitted, time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        with self._lock:
+            operations = {name: op.snapshot() for name, op in self.operations.items()}
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            **operations,
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
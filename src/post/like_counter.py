@@ -0,0 +1,93 @@
+# Write-behind likes_count - deltas collect in memory and land in one batched UPDATE per interval
+from sqlalchemy import case, update
+from typing import Dict, Optional
+from .models import Post
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LikeCounterBuffer:
+    """Per-post likes_count deltas not yet written to the posts table"""
+    def __init__(self, interval_ms: int = 250):
+        self.interval = interval_ms / 1000
+        self.pending: Dict[int, int] = {}
+        self.in_flight: Dict[int, int] = {}  # swapped out by a flush that has not committed yet
+        self.flushes = 0
+        self.flushed_posts = 0
+        self.failures = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stopping: Optional[asyncio.Event] = None
+
+    def add(self, post_id: int, delta: int):
+        total = self.pending.get(post_id, 0) + delta
+        if total:
+            self.pending[post_id] = total
+        else:
+            self.pending.pop(post_id, None)
+
+    def delta(self, post_id: int) -> int:
+        """Likes recorded for a post that readers should see but the posts row does not have yet"""
+        return self.pending.get(post_id, 0) + self.in_flight.get(post_id, 0)
+
+    async def flush(self, session_factory) -> int:
+        if not self.pending:
+            return 0
+        # swap rather than copy so likes arriving mid-flush go into the next batch
+        deltas, self.pending = self.pending, {}
+        self.in_flight = deltas
+        try:
+            async with session_factory() as db:
+                await db.execute(
+                    update(Post).where(Post.id.in_(deltas))
+                    .values(likes_count=Post.likes_count + case(deltas, value=Post.id, else_=0))
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        except Exception:
+            self.failures += 1
+            for post_id, delta in deltas.items():
+                self.add(post_id, delta)
+            raise
+        finally:
+            self.in_flight = {}
+        self.flushes += 1
+        self.flushed_posts += len(deltas)
+        return len(deltas)
+
+    async def _run(self, session_factory):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush(session_factory)
+            except Exception as e:
+                logger.error(f"like counter flush failed, retrying next interval: {e}")
+
+    def start(self, session_factory):
+        if self._task is None:
+            self._stopping = asyncio.Event()
+            self._task = asyncio.create_task(self._run(session_factory))
+
+    async def stop(self, session_factory):
+        """Stop the background flusher and write whatever is still pending
+
+        The task is signalled rather than cancelled: cancelling it mid-flush would leave the
+        swapped-out deltas neither committed nor back in pending.
+        """
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush(session_factory)
+
+    def stats(self) -> dict:
+        return {
+            "pending_posts": len(self.pending),
+            "pending_likes": sum(self.pending.values()),
+            "flushes": self.flushes,
+            "flushed_posts": self.flushed_posts,
+            "failures": self.failures,
+        }
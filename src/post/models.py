@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Date,Table
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Date,Table,Index,UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from sqlalchemy.sql import func
-from database import Base
+from database import Base, Timestamp
 
 #assosiation table for many-to-many relationship between posts and hashtags
 
@@ -10,7 +10,11 @@ post_hashtags=Table(
   "post_hashtags",
   Base.metadata,
   Column("post_id", Integer, ForeignKey("posts.id")),
-  Column("hashtag_id", Integer, ForeignKey("hashtags.id"))
+  Column("hashtag_id", Integer, ForeignKey("hashtags.id")),
+  # copy of posts.created_at so a hashtag's newest posts are one index range scan; create_all won't
+  # add it to an existing table - ALTER TABLE ADD COLUMN, backfill from posts.created_at, then the index
+  Column("created_at", Timestamp),
+  Index("ix_post_hashtags_hashtag_created_post","hashtag_id","created_at","post_id"),
 )
 
 #association table for many-to-many relationship between users and posts
@@ -18,17 +22,28 @@ post_likes=Table(
   "post_likes",
   Base.metadata,
   Column("user_id", Integer, ForeignKey("user.id")),
-  Column("post_id", Integer, ForeignKey("posts.id"))
+  Column("post_id", Integer, ForeignKey("posts.id")),
+  # one like per user per post - also the index behind the "did I like this" existence check. create_all
+  # won't add it to an existing table: drop duplicate pairs first, then reconcile posts.likes_count
+  UniqueConstraint("user_id","post_id",name="uq_post_likes_user_post"),
+  # likers of a post, paged by user id
+  Index("ix_post_likes_post_user","post_id","user_id"),
 )
 
 
 class Post(Base):
   __tablename__ = "posts"
+  __table_args__ = (
+    # feed keyset pagination walks (created_at, id) in descending order
+    Index("ix_posts_created_at_id","created_at","id"),
+    # per-author recency scans (profile pages, high-follower timeline merge)
+    Index("ix_posts_author_created_at_id","author_id","created_at","id"),
+  )
   id =Column(Integer,primary_key=True,index=True)
   content=Column(String(255),unique=True)
   image=Column(String(255))
   location=Column(String(255))
-  created_at=Column(DateTime, default=func.now()) 
+  created_at=Column(Timestamp, default=func.now()) 
   likes_count=Column(Integer, default=0)
   
   author_id=Column(Integer,ForeignKey("user.id"))
@@ -40,9 +55,20 @@ class Post(Base):
 class Hashtag(Base):
   __tablename__ = "hashtags"
   id =Column(Integer,primary_key=True,index=True)
-  name=Column(String(255),index=True)
+  # tag creation relies on this key (insert-or-ignore, then re-select by name); create_all won't add it
+  # to an existing table - merge duplicate names into their lowest id first, then add the unique index
+  name=Column(String(255),unique=True,index=True)
   
   posts=relationship("Post",secondary=post_hashtags,back_populates="hashtags")
 
-  
-  
\ No newline at end of file
+
+# materialized "posts from people I follow" - one row per (reader, post), written at post time
+class TimelineEntry(Base):
+  __tablename__ = "home_timeline"
+  __table_args__ = (
+    Index("ix_home_timeline_user_created_post","user_id","created_at","post_id"),
+  )
+  user_id=Column(Integer,ForeignKey("user.id"),primary_key=True)
+  post_id=Column(Integer,ForeignKey("posts.id"),primary_key=True,index=True)
+  author_id=Column(Integer,ForeignKey("user.id"))
+  created_at=Column(Timestamp)
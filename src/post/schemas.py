@@ -1,8 +1,9 @@
 from pydantic import BaseModel,field_validator,Field
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
 import re
 from security_utils import sanitizer
+from pagination import Page
 
 class Hashtag(BaseModel):
     id: int
@@ -47,4 +48,19 @@ class Post(PostCreate):
     created_at: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class FeedPost(Post):
+    username: Optional[str] = None
+    liked_by_me: Optional[bool] = None  # only set when the request carries a valid token
+
+class FeedPage(Page[FeedPost]):
+    pass
+
+class TrendingHashtag(BaseModel):
+    name: str
+    count: int  # approximate, may overestimate slightly once the tag set exceeds the tracker's capacity
+
+class Trending(BaseModel):
+    window: str
+    hashtags: List[TrendingHashtag] = []
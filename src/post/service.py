@@ -1,29 +1,67 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import delete, desc, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 import re
-from .schemas import PostCreate,Post as PostSchema, Hashtag
+from datetime import datetime
+from .schemas import PostCreate,Post as PostSchema, Hashtag, FeedPage, Trending
 from auth.schemas import User as UserSchema
-from .models import Post,post_hashtags,Hashtag
+from .models import Post,post_hashtags,post_likes,Hashtag
+from .timeline import fan_out_post, remove_post_from_timelines, home_timeline_keys, recent_posts
+from .trending import TrendingHashtags
+from .like_counter import LikeCounterBuffer
 from auth.models import User
-from activity.models import Activity
+from activity.writer import record_activity
 from security_utils import sanitizer
+from pagination import Page, decode_cursor, keyset_before, page_limit, split_page
+from database import insert_ignore
+from cache import LRUCache
+from config import settings
 
-#create hashtag
-async def create_hashtag_svc(db:Session,post:Post):
-    regex=r"#\w+"
-    matches=re.findall(regex,post.content)
-    for match in matches:
-        name=match[1:]
-        hashtag=db.query(Hashtag).filter(Hashtag.name==name).first()
-        if not hashtag:
-           hashtag=Hashtag(name=name)
-           db.add(hashtag)
-           db.commit()
-        post.hashtags.append(hashtag)
+# hot hashtag name -> id, filled only from rows that were already committed so a rollback can't leave stale ids
+hashtag_ids=LRUCache(maxsize=settings.hashtag_cache_size)
+
+# per-process heavy hitters, fed as tags are written so the trending endpoint never scans post_hashtags
+trending_hashtags=TrendingHashtags(settings.trending_capacity,settings.trending_refresh_seconds)
+
+# unflushed likes_count deltas, only used when LIKE_WRITE_BEHIND is on
+like_counters=LikeCounterBuffer(settings.like_flush_interval_ms)
+
+#create hashtag - returns the post's tag names, for the caller to count once the post commits
+async def create_hashtag_svc(db:AsyncSession,post:Post):
+    # dict.fromkeys collapses repeated tags while keeping their order
+    names=list(dict.fromkeys(match[1:] for match in re.findall(r"#\w+",post.content)))
+    if not names:
+      return names
+    ids={}
+    missing=[]
+    for name in names:
+      hashtag_id=hashtag_ids.get(name)
+      if hashtag_id is None:
+        missing.append(name)
+      else:
+        ids[name]=hashtag_id
+    if missing:
+      found=await db.execute(select(Hashtag.name,Hashtag.id).where(Hashtag.name.in_(missing)))
+      for name,hashtag_id in found:
+        ids[name]=hashtag_id
+        hashtag_ids.set(name,hashtag_id)
+      new_names=[name for name in missing if name not in ids]
+      if new_names:
+        # insert-or-ignore so two posts introducing the same tag at once don't collide on the unique name
+        await db.execute(insert_ignore(Hashtag),[{"name":name} for name in new_names])
+        created=await db.execute(select(Hashtag.name,Hashtag.id).where(Hashtag.name.in_(new_names)))
+        ids.update(dict(created.all()))
+    # created_at comes from the flushed post row, it is filled by the database default
+    await db.execute(insert(post_hashtags).from_select(
+      ["post_id","hashtag_id","created_at"],
+      # an explicit join: one row per tag id for this post, not a cartesian product of the tables
+      select(Post.id,Hashtag.id,Post.created_at).select_from(Post)
+      .join(Hashtag,Hashtag.id.in_(ids.values())).where(Post.id==post.id),
+    ))
+    return names
                 
 
 #create a post
-async def create_post_svc(db:Session,post:PostCreate,user_id:int):
+async def create_post_svc(db:AsyncSession,post:PostCreate,user_id:int):
     # Additional sanitization at service layer (defense in depth)
     sanitized_content = sanitizer.sanitize_html(post.content) if post.content else ""
     sanitized_image = sanitizer.sanitize_html(post.image) if post.image else None
@@ -35,101 +73,176 @@ async def create_post_svc(db:Session,post:PostCreate,user_id:int):
       location=sanitized_location,
       author_id=user_id
       )
-    await create_hashtag_svc(db,db_post)
     db.add(db_post)
-    db.commit()
+    await db.flush()
+    names=await create_hashtag_svc(db,db_post)
+    await fan_out_post(db,db_post.id,user_id)
+    await db.commit()
+    # counted only once the post is durable, so a rolled-back post never trends
+    trending_hashtags.record(names)
+    await db.refresh(db_post)
+    recent_posts.add(user_id,db_post.created_at,db_post.id)
     return db_post
 
-#get user's post
-async def get_user_posts_svc(db:Session,user_id:int)->list[PostSchema]:
-    posts=db.query(Post).filter(Post.author_id==user_id).order_by(desc(Post.created_at)).all()
-    return posts
+#get user's posts, newest first - keyset paginated on (created_at, id) of the author index
+async def get_user_posts_svc(db:AsyncSession,user_id:int,limit:int=10,cursor:str=None,viewer_id:int=None)->FeedPage:
+    limit=page_limit(limit)
+    posts=select(Post,User.username).join(User,User.id==Post.author_id).where(
+      Post.author_id==user_id
+    ).order_by(desc(Post.created_at),desc(Post.id)).limit(limit+1)
+    if cursor:
+      posts=posts.where(keyset_before((Post.created_at,Post.id),decode_cursor(cursor,datetime,int)))
+    rows,next_cursor=split_page((await db.execute(posts)).all(),limit,lambda row:(row[0].created_at,row[0].id))
+    items=[_post_item(post,username) for post,username in rows]
+    return FeedPage(items=await _mark_liked(db,items,viewer_id),next_cursor=next_cursor)
   
-# get posts from a hashtag
-async def get_posts_from_hashtag_svc(db:Session,hashtag_name:str):
-    hashtag=db.query(Hashtag).filter(Hashtag.name==hashtag_name).first()
-    if not hashtag:
-      return None
-    return hashtag.posts
+# get posts from a hashtag, newest first - keyset paginated on (created_at, post_id) of the tag's index
+async def get_posts_from_hashtag_svc(db:AsyncSession,hashtag_name:str,limit:int=10,cursor:str=None,viewer_id:int=None)->FeedPage:
+    hashtag_id=hashtag_ids.get(hashtag_name)
+    if hashtag_id is None:
+      hashtag_id=await db.scalar(select(Hashtag.id).where(Hashtag.name==hashtag_name))
+      if hashtag_id is None:
+        return None
+      hashtag_ids.set(hashtag_name,hashtag_id)
+    limit=page_limit(limit)
+    keys=select(post_hashtags.c.post_id,post_hashtags.c.created_at).where(
+      post_hashtags.c.hashtag_id==hashtag_id
+    ).order_by(desc(post_hashtags.c.created_at),desc(post_hashtags.c.post_id)).limit(limit+1)
+    if cursor:
+      keys=keys.where(keyset_before((post_hashtags.c.created_at,post_hashtags.c.post_id),decode_cursor(cursor,datetime,int)))
+    keys=keys.subquery()
+    rows=(await db.execute(
+      select(Post,User.username).join(keys,keys.c.post_id==Post.id).join(User,User.id==Post.author_id)
+      .order_by(desc(keys.c.created_at),desc(keys.c.post_id))
+    )).all()
+    rows,next_cursor=split_page(rows,limit,lambda row:(row[0].created_at,row[0].id))
+    items=[_post_item(post,username) for post,username in rows]
+    return FeedPage(items=await _mark_liked(db,items,viewer_id),next_cursor=next_cursor)
+
+# top hashtags over the last hour or day
+def get_trending_hashtags_svc(window:str="hour",limit:int=10)->Trending:
+    limit=min(max(limit,1),settings.trending_max_results)
+    return Trending(window=window,hashtags=[
+      {"name":name,"count":count} for name,count in trending_hashtags.top(window,limit)
+    ])
 
 #get user from username
-async def get_user_from_username(db:Session,username:str):
-    return db.query(User).filter(User.username==username).first()
+async def get_user_from_username(db:AsyncSession,username:str):
+    return await db.scalar(select(User).where(User.username==username))
   
-#get random posts for feeds
-async def get_random_posts_svc(db:Session,page:int=1,limit:int=10,hashtag:str=None):
-    total_posts=db.query(Post).count()
-    offset=(page-1)*limit
-    if offset >=total_posts:
-        return []
-    posts=db.query(Post,User.username).join(User).order_by(desc(Post.created_at))
+# plain dict of a post's columns plus its author's username, with likes not yet flushed counted in
+def _post_item(post:Post,username:str=None)->dict:
+    item={column.key:getattr(post,column.key) for column in Post.__table__.columns}
+    item["likes_count"]=(item["likes_count"] or 0)+like_counters.delta(post.id)
+    item["username"]=username
+    return item
+
+# set liked_by_me on a page of post items - one post_likes lookup for the whole page
+async def _mark_liked(db:AsyncSession,items:list,viewer_id:int=None)->list:
+    if viewer_id is None or not items:
+      return items
+    liked=set(await db.scalars(select(post_likes.c.post_id).where(
+      post_likes.c.user_id==viewer_id,post_likes.c.post_id.in_([item["id"] for item in items])
+    )))
+    for item in items:
+      item["liked_by_me"]=item["id"] in liked
+    return items
+
+#get random posts for feeds - keyset paginated on (created_at, id), `page` kept for old clients
+async def get_random_posts_svc(db:AsyncSession,page:int=1,limit:int=10,hashtag:str=None,cursor:str=None,viewer_id:int=None)->FeedPage:
+    limit=page_limit(limit)
+    posts=select(Post,User.username).join(User).order_by(desc(Post.created_at),desc(Post.id))
     
     if hashtag:
-      posts=posts.join(post_hashtags).join(Hashtag).filter(Hashtag.name==hashtag)
-    posts=posts.offset(offset).limit(limit).all()
-    result=[]
-    for post,username in posts:
-        post_dict=post.__dict__
-        post_dict["username"]=username
-        result.append(post_dict)
-    return result
+      posts=posts.join(post_hashtags).join(Hashtag).where(Hashtag.name==hashtag)
+    if cursor:
+      posts=posts.where(keyset_before((Post.created_at,Post.id),decode_cursor(cursor,datetime,int)))
+    elif page>1:
+      posts=posts.offset((page-1)*limit)
+    rows,next_cursor=split_page((await db.execute(posts.limit(limit+1))).all(),limit,lambda row:(row[0].created_at,row[0].id))
+    items=[_post_item(post,username) for post,username in rows]
+    return FeedPage(items=await _mark_liked(db,items,viewer_id),next_cursor=next_cursor)
+  
+#get the home timeline - posts from followed users, keyset paginated on (created_at, post_id)
+async def get_home_timeline_svc(db:AsyncSession,user_id:int,limit:int=10,cursor:str=None)->FeedPage:
+    limit=page_limit(limit)
+    before=decode_cursor(cursor,datetime,int) if cursor else None
+    keys,next_cursor=split_page(await home_timeline_keys(db,user_id,limit+1,before),limit,tuple)
+    if not keys:
+      return FeedPage(items=[],next_cursor=None)
+    post_ids=[post_id for _,post_id in keys]
+    rows=(await db.execute(select(Post,User.username).join(User,User.id==Post.author_id).where(Post.id.in_(post_ids)))).all()
+    by_id={post.id:(post,username) for post,username in rows}
+    items=[_post_item(*by_id[post_id]) for post_id in post_ids if post_id in by_id]
+    return FeedPage(items=await _mark_liked(db,items,user_id),next_cursor=next_cursor)
   
 # get post by post_id
-async def get_post_from_post_id_svc(db:Session,post_id:int)->PostSchema:
-    return db.query(Post).filter(Post.id==post_id).first()
+async def get_post_from_post_id_svc(db:AsyncSession,post_id:int)->PostSchema:
+    return await db.scalar(select(Post).where(Post.id==post_id))
+
+# get a post for display
+async def get_post_svc(db:AsyncSession,post_id:int)->PostSchema:
+    post=await get_post_from_post_id_svc(db,post_id)
+    return _post_item(post) if post else None
   
 # delete post 
-async def delete_post_svc(db:Session,post_id:int):
+async def delete_post_svc(db:AsyncSession,post_id:int):
    post=await get_post_from_post_id_svc(db, post_id)
-   db.delete(post)
-   db.commit()
+   await remove_post_from_timelines(db, post_id, post.author_id)
+   await db.delete(post)
+   await db.commit()
     
-# like a post
-async def like_post_svc(db:Session,post_id:int,username:str):
-    post = await get_post_from_post_id_svc(db, post_id)
+# like a post - the unique (user_id, post_id) key makes this O(1) however many likes the post has
+# user_id and username come from the caller's cached principal, so there is no user lookup here
+async def like_post_svc(db:AsyncSession,post_id:int,user_id:int,username:str):
+    post=(await db.execute(
+      select(Post.image,User.username).join(User,User.id==Post.author_id).where(Post.id==post_id)
+    )).first()
     if not post:
         return False,"invalid post"
-    user = db.query(User).filter(User.username==username).first()  # Remove await here
-    if not user:
-        return False,"invalid user"
-    if user in post.liked_by_users:
+    inserted=await db.execute(insert_ignore(post_likes).values(user_id=user_id,post_id=post_id))
+    if not inserted.rowcount:
         return False,"already liked"
-    post.liked_by_users.append(user)
-    post.likes_count = len(post.liked_by_users)
-    
-    # activity 
-    like_activity = Activity(
-        username=post.author.username,
+    # counted in SQL so concurrent likes can't overwrite each other's increment
+    if not settings.like_write_behind:
+        await db.execute(update(Post).where(Post.id==post_id).values(likes_count=Post.likes_count+1))
+    await db.commit()
+    if settings.like_write_behind:
+        like_counters.add(post_id,1)
+    # the activity row is written after the like commits, off the request's transaction
+    await record_activity(db,
+        username=post.username,
         liked_post_id=post_id,
-        username_liked=username,  # Fix: was username_like
-        liked_post_image=post.image
+        username_liked=username,
+        liked_post_image=post.image,
     )
-    db.add(like_activity)
-    db.commit()
     return True,"Post liked successfully"
   
 # unlike a post
-async def unlike_post_svc(db:Session,post_id:int,username:str):
-    post = await get_post_from_post_id_svc(db, post_id)
-    if not post:
+async def unlike_post_svc(db:AsyncSession,post_id:int,user_id:int):
+    if not await db.scalar(select(Post.id).where(Post.id==post_id)):
        return False,"invalid post"
-    user = db.query(User).filter(User.username==username).first()  # Remove await here
-    if not user:
-       return False,"invalid user"
-    if user not in post.liked_by_users:  # Fix: use 'not in'
+    deleted=await db.execute(delete(post_likes).where(post_likes.c.user_id==user_id,post_likes.c.post_id==post_id))
+    if not deleted.rowcount:
        return False,"already not liked"
-    post.liked_by_users.remove(user)
-    post.likes_count = len(post.liked_by_users)  # Use likes_count to match your model
-    db.commit()
+    if settings.like_write_behind:
+       await db.commit()
+       like_counters.add(post_id,-1)
+    else:
+       await db.execute(update(Post).where(Post.id==post_id).values(likes_count=Post.likes_count-1))
+       await db.commit()
     return True,"Post unliked successfully"  # Add return statement
 
-#users who liked a post
-async def liked_users_post_svc(db:Session,post_id:int)->list[UserSchema]:
-    post = await get_post_from_post_id_svc(db,post_id)
-    if not post:
-       return []
-    liked_users=post.liked_by_users
-    return liked_users
+#users who liked a post - keyset paginated on user id over the (post_id, user_id) index
+async def liked_users_post_svc(db:AsyncSession,post_id:int,limit:int=10,cursor:str=None)->Page[UserSchema]:
+    limit=page_limit(limit)
+    likers=select(User).join(post_likes,post_likes.c.user_id==User.id).where(
+      post_likes.c.post_id==post_id
+    ).order_by(desc(post_likes.c.user_id)).limit(limit+1)
+    if cursor:
+      likers=likers.where(keyset_before((post_likes.c.user_id,),decode_cursor(cursor,int)))
+    users,next_cursor=split_page((await db.scalars(likers)).all(),limit,lambda user:(user.id,))
+    return Page[UserSchema](items=users,next_cursor=next_cursor)
 
 
 
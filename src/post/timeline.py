@@ -0,0 +1,133 @@
+# Home timeline - fan-out-on-write for regular authors, pull-on-read for high-follower authors
+from sqlalchemy import delete, desc, func, insert, literal, select, tuple_, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import Post, TimelineEntry
+from auth.models import Follow, User
+from cache import LRUCache
+from config import settings
+from pagination import keyset_before
+import heapq
+
+TIMELINE_COLUMNS = ["user_id", "post_id", "author_id", "created_at"]
+
+class RecentPostsCache:
+    """Newest (created_at, post_id) keys per high-follower author, merged into timelines at read time"""
+    def __init__(self, per_author: int, max_authors: int = 1024, ttl: int = 30):
+        self.per_author = per_author
+        self.authors = LRUCache(maxsize=max_authors, ttl=ttl)
+
+    async def get(self, db: AsyncSession, author_id: int) -> list:
+        keys = self.authors.get(author_id)
+        if keys is None:
+            rows = await db.execute(
+                select(Post.created_at, Post.id).where(Post.author_id == author_id)
+                .order_by(desc(Post.created_at), desc(Post.id)).limit(self.per_author)
+            )
+            keys = [tuple(row) for row in rows]
+            self.authors.set(author_id, keys)
+        return keys
+
+    def add(self, author_id: int, created_at, post_id: int):
+        # only authors somebody has already pulled are cached, so this is a no-op for everyone else
+        keys = self.authors.get(author_id)
+        if keys is not None:
+            keys.insert(0, (created_at, post_id))
+            del keys[self.per_author:]
+
+    def discard(self, author_id: int):
+        self.authors.pop(author_id)
+
+recent_posts = RecentPostsCache(settings.recent_posts_per_author, ttl=settings.recent_posts_ttl)
+
+def is_celebrity(followers_count: int) -> bool:
+    return (followers_count or 0) >= settings.celebrity_follower_threshold
+
+# push a new post into the author's and every follower's timeline
+async def fan_out_post(db:AsyncSession, post_id:int, author_id:int):
+    own=select(Post.author_id,Post.id,Post.author_id,Post.created_at).where(Post.id==post_id)
+    followers_count=await db.scalar(select(User.followers_count).where(User.id==author_id))
+    # trimming every reader on every post would rescan whole timelines, so each reader - the
+    # author included - is trimmed on roughly one in `timeline_trim_every` fan-outs
+    trim_author=(author_id+post_id)%settings.timeline_trim_every==0
+    if is_celebrity(followers_count):
+      # followers pull this author's posts from recent_posts instead of getting one row each
+      await db.execute(insert(TimelineEntry).from_select(TIMELINE_COLUMNS,own))
+      if trim_author:
+        await trim_timelines(db,[author_id])
+      return
+    followers=select(Follow.follower_id,Post.id,Post.author_id,Post.created_at).join(
+      Post,Post.author_id==Follow.following_id
+    ).where(Post.id==post_id)
+    await db.execute(insert(TimelineEntry).from_select(TIMELINE_COLUMNS,union_all(own,followers)))
+    readers=select(Follow.follower_id).where(
+      Follow.following_id==author_id,
+      (Follow.follower_id+post_id)%settings.timeline_trim_every==0,
+    )
+    if trim_author:
+      readers=union_all(readers,select(literal(author_id)))
+    await trim_timelines(db,readers)
+
+# copy the followed author's recent posts into the follower's timeline
+async def backfill_timeline(db:AsyncSession, follower_id:int, author_id:int, author_followers:int=0):
+    if is_celebrity(author_followers):
+      return
+    recent=select(literal(follower_id),Post.id,Post.author_id,Post.created_at).where(
+      Post.author_id==author_id
+    ).order_by(desc(Post.created_at),desc(Post.id)).limit(settings.timeline_max_length)
+    await db.execute(insert(TimelineEntry).from_select(TIMELINE_COLUMNS,recent))
+    await trim_timelines(db,[follower_id])
+
+# drop an unfollowed author's posts from the follower's timeline
+async def prune_timeline(db:AsyncSession, follower_id:int, author_id:int):
+    await db.execute(delete(TimelineEntry).where(
+      TimelineEntry.user_id==follower_id,
+      TimelineEntry.author_id==author_id,
+    ))
+
+async def remove_post_from_timelines(db:AsyncSession, post_id:int, author_id:int):
+    await db.execute(delete(TimelineEntry).where(TimelineEntry.post_id==post_id))
+    recent_posts.discard(author_id)
+
+# keep only the newest `timeline_max_length` entries of each listed timeline
+async def trim_timelines(db:AsyncSession, user_ids):
+    ranked=select(
+      TimelineEntry.user_id,
+      TimelineEntry.post_id,
+      func.row_number().over(
+        partition_by=TimelineEntry.user_id,
+        order_by=(desc(TimelineEntry.created_at),desc(TimelineEntry.post_id)),
+      ).label("position"),
+    ).where(TimelineEntry.user_id.in_(user_ids)).subquery()
+    # selecting from the ranked subquery again forces MySQL to materialize it before deleting
+    stale=select(ranked.c.user_id,ranked.c.post_id).where(ranked.c.position>settings.timeline_max_length).subquery()
+    await db.execute(delete(TimelineEntry).where(
+      tuple_(TimelineEntry.user_id,TimelineEntry.post_id).in_(select(stale.c.user_id,stale.c.post_id))
+    ))
+
+# newest `limit` (created_at, post_id) keys of a user's timeline older than `before`:
+# the materialized rows k-way merged with the recent posts of every followed high-follower author
+async def home_timeline_keys(db:AsyncSession, user_id:int, limit:int, before:tuple=None) -> list:
+    pushed=select(TimelineEntry.created_at,TimelineEntry.post_id).where(TimelineEntry.user_id==user_id).order_by(
+      desc(TimelineEntry.created_at),desc(TimelineEntry.post_id)
+    ).limit(limit)
+    if before:
+      pushed=pushed.where(keyset_before((TimelineEntry.created_at,TimelineEntry.post_id),before))
+    sources=[[tuple(row) for row in await db.execute(pushed)]]
+
+    celebrities=await db.scalars(select(Follow.following_id).join(User,User.id==Follow.following_id).where(
+      Follow.follower_id==user_id,
+      User.followers_count>=settings.celebrity_follower_threshold,
+    ))
+    for author_id in celebrities.all():
+      keys=await recent_posts.get(db,author_id)
+      sources.append([key for key in keys if key<before] if before else keys)
+
+    merged,seen=[],set()
+    for key in heapq.merge(*sources,reverse=True):
+      if key[1] in seen:
+        continue
+      seen.add(key[1])
+      merged.append(key)
+      if len(merged)==limit:
+        break
+    return merged
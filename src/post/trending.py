@@ -0,0 +1,133 @@
+# Trending hashtags - approximate top-K over sliding windows in bounded memory, fed as posts are created
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+import heapq
+import threading
+import time
+
+class SpaceSaving:
+    """Heavy-hitters summary (Metwally et al.): at most `capacity` counters, overestimates by at most `error`
+
+    Counters are grouped by count (the paper's stream-summary), so finding and replacing the
+    smallest one is O(1) rather than a scan over every counter.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.by_count: Dict[int, Dict[str, None]] = {}  # count -> names holding it, oldest first
+        self.min_count = 0
+
+    def add(self, name: str) -> Optional[Tuple[str, int]]:
+        """Count one occurrence, returning (name, count) of the counter evicted to make room"""
+        count = self.counts.get(name)
+        if count is not None:
+            self._move(name, count, count + 1)
+            return None
+        if len(self.counts) < self.capacity:
+            self.errors[name] = 0
+            self._place(name, 1)
+            self.min_count = 1
+            return None
+        # the newcomer takes over the smallest counter and inherits its count as possible error
+        floor = self.min_count
+        victims = self.by_count[floor]
+        victim = next(iter(victims))
+        self._remove(victim, floor)
+        del self.counts[victim]
+        del self.errors[victim]
+        self.errors[name] = floor
+        self._place(name, floor + 1)
+        if floor not in self.by_count:
+            self.min_count = floor + 1
+        return victim, floor
+
+    def _place(self, name: str, count: int):
+        self.counts[name] = count
+        self.by_count.setdefault(count, {})[name] = None
+
+    def _remove(self, name: str, count: int):
+        names = self.by_count[count]
+        del names[name]
+        if not names:
+            del self.by_count[count]
+
+    def _move(self, name: str, old: int, new: int):
+        self._remove(name, old)
+        self._place(name, new)
+        if old == self.min_count and old not in self.by_count:
+            self.min_count = new
+
+class SlidingTopK:
+    """Space-saving summaries per time bucket, summed over the buckets still inside the window"""
+    def __init__(self, window_seconds: int, bucket_seconds: int, capacity: int, refresh_seconds: float = 5):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.capacity = capacity
+        self.refresh_seconds = refresh_seconds
+        self.buckets: "deque[Tuple[int, SpaceSaving]]" = deque()
+        self.totals: Dict[str, int] = {}
+        self._ranking: List[Tuple[str, int]] = []
+        self._ranked_at: Optional[float] = None
+
+    def add(self, name: str, now: float):
+        self._expire(now)
+        start = int(now // self.bucket_seconds) * self.bucket_seconds
+        if not self.buckets or self.buckets[-1][0] != start:
+            self.buckets.append((start, SpaceSaving(self.capacity)))
+        evicted = self.buckets[-1][1].add(name)
+        if evicted:
+            victim, count = evicted
+            self._subtract(victim, count)
+        self.totals[name] = self.totals.get(name, 0) + (evicted[1] + 1 if evicted else 1)
+
+    def top(self, k: int, now: float) -> List[Tuple[str, int]]:
+        # the ranking is rebuilt at most once per refresh interval, so reads are a slice of a ready list
+        if self._ranked_at is None or now - self._ranked_at >= self.refresh_seconds or len(self._ranking) < k <= len(self.totals):
+            self._expire(now)
+            self._ranking = heapq.nlargest(max(k, self.capacity), self.totals.items(), key=lambda item: item[1])
+            self._ranked_at = now
+        return self._ranking[:k]
+
+    def _expire(self, now: float):
+        while self.buckets and self.buckets[0][0] + self.bucket_seconds <= now - self.window_seconds:
+            _, summary = self.buckets.popleft()
+            for name, count in summary.counts.items():
+                self._subtract(name, count)
+
+    def _subtract(self, name: str, count: int):
+        remaining = self.totals.get(name, 0) - count
+        if remaining > 0:
+            self.totals[name] = remaining
+        else:
+            self.totals.pop(name, None)
+
+class TrendingHashtags:
+    """Top hashtags over the last hour (minute buckets) and the last day (hour buckets)"""
+    def __init__(self, capacity: int = 1000, refresh_seconds: float = 5):
+        self.windows = {
+            "hour": SlidingTopK(3600, 60, capacity, refresh_seconds),
+            "day": SlidingTopK(86400, 3600, capacity, refresh_seconds),
+        }
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    def record(self, names, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            for name in names:
+                self.recorded += 1
+                for window in self.windows.values():
+                    window.add(name, now)
+
+    def top(self, window: str, k: int = 10, now: Optional[float] = None) -> List[Tuple[str, int]]:
+        now = time.time() if now is None else now
+        with self._lock:
+            return self.windows[window].top(k, now)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "recorded": self.recorded,
+                **{name: {"buckets": len(w.buckets), "tracked": len(w.totals)} for name, w in self.windows.items()},
+            }
@@ -1,17 +1,19 @@
 from fastapi import APIRouter,Depends,status,HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
-from .schemas import PostCreate,Post
-from .service import create_post_svc,delete_post_svc,create_hashtag_svc,get_post_from_post_id_svc,get_random_posts_svc,get_user_posts_svc,liked_users_post_svc,unlike_post_svc,get_posts_from_hashtag_svc,like_post_svc,get_user_from_username
-from auth.service import get_current_user
-from auth.schemas import User
+from .schemas import PostCreate,Post,FeedPage,Trending
+from .service import create_post_svc,delete_post_svc,create_hashtag_svc,get_post_from_post_id_svc,get_random_posts_svc,get_user_posts_svc,get_home_timeline_svc,liked_users_post_svc,unlike_post_svc,get_posts_from_hashtag_svc,like_post_svc,get_user_from_username,get_trending_hashtags_svc,get_post_svc
+from auth.service import get_current_user, get_optional_user
+from auth.schemas import User, UserPrincipal
 from rate_limiter import general_rate_limit, api_rate_limit
+from pagination import InvalidCursor, Page
+from typing import Literal
 
 router=APIRouter(prefix="/posts",tags=["posts"])
 
 # fastapi dependency injection is implemented to get the current user from the token
 @router.post("/",response_model=Post,status_code=status.HTTP_201_CREATED)
-async def create_post(post:PostCreate, _: bool = Depends(general_rate_limit), user:User=Depends(get_current_user), db:Session=Depends(get_db)):
+async def create_post(post:PostCreate, _: bool = Depends(general_rate_limit), user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
     if not user:
        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="you are not authorized")
     
@@ -20,34 +22,63 @@ async def create_post(post:PostCreate, _: bool = Depends(general_rate_limit), us
     return db_post
    
 #get current user's posts 
-@router.get("/user",response_model=list[Post])
-async def get_current_user_posts(_: bool = Depends(api_rate_limit), user:User=Depends(get_current_user), db:Session=Depends(get_db)):
+@router.get("/user",response_model=FeedPage)
+async def get_current_user_posts(limit:int=10,cursor:str=None, _: bool = Depends(api_rate_limit), user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
     if not user:
        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="you are not authorized")
-    return await get_user_posts_svc(db,user.id)
+    try:
+        return await get_user_posts_svc(db,user.id,limit,cursor,user.id)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid cursor")
 
 #get posts of a user
-@router.get("/user/{username}",response_model=list[Post])
-async def get_user_posts(username:str, _: bool = Depends(api_rate_limit), db:Session=Depends(get_db)):
+@router.get("/user/{username}",response_model=FeedPage)
+async def get_user_posts(username:str,limit:int=10,cursor:str=None, _: bool = Depends(api_rate_limit), viewer:UserPrincipal=Depends(get_optional_user), db:AsyncSession=Depends(get_db)):
     user= await get_user_from_username(db,username)
     if not user:
        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail="User not found")
-    
-    return await get_user_posts_svc(db,user.id)
+    try:
+        return await get_user_posts_svc(db,user.id,limit,cursor,viewer.id if viewer else None)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid cursor")
+
+# trending hashtags over the last hour or day
+@router.get("/hashtags/trending",response_model=Trending)
+async def get_trending_hashtags(window:Literal["hour","day"]="hour",limit:int=10, _: bool = Depends(api_rate_limit)):
+    return get_trending_hashtags_svc(window,limit)
 
 # get posts from hashtag
-@router.get("/hashtag/{hashtag}",response_model=list[Post])
-async def get_posts_from_hashtag(hashtag:str, _: bool = Depends(api_rate_limit), db:Session=Depends(get_db)):
-    return await get_posts_from_hashtag_svc(db,hashtag)
+@router.get("/hashtag/{hashtag}",response_model=FeedPage)
+async def get_posts_from_hashtag(hashtag:str,limit:int=10,cursor:str=None, _: bool = Depends(api_rate_limit), viewer:UserPrincipal=Depends(get_optional_user), db:AsyncSession=Depends(get_db)):
+    try:
+        posts=await get_posts_from_hashtag_svc(db,hashtag,limit,cursor,viewer.id if viewer else None)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid cursor")
+    if posts is None:
+       raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail="Hashtag not found")
+    return posts
   
-# get random posts
-@router.get("/feed",response_model=list[Post])
-async def get_random_posts(page:int=1,limit:int=5,hashtag:str=None, _: bool = Depends(api_rate_limit), db:Session=Depends(get_db)):
-    return await get_random_posts_svc(db,page,limit,hashtag)
+# get random posts - pass back next_cursor to fetch the following page
+@router.get("/feed",response_model=FeedPage)
+async def get_random_posts(page:int=1,limit:int=5,hashtag:str=None,cursor:str=None, _: bool = Depends(api_rate_limit), viewer:UserPrincipal=Depends(get_optional_user), db:AsyncSession=Depends(get_db)):
+    try:
+        return await get_random_posts_svc(db,page,limit,hashtag,cursor,viewer.id if viewer else None)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid cursor")
+
+# home timeline - posts from the users you follow
+@router.get("/home",response_model=FeedPage)
+async def get_home_timeline(limit:int=10,cursor:str=None, _: bool = Depends(api_rate_limit), user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
+    if not user:
+       raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="you are not authorized")
+    try:
+        return await get_home_timeline_svc(db,user.id,limit,cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid cursor")
   
 # delete a post
 @router.delete("/",status_code=status.HTTP_204_NO_CONTENT)
-async def delete_post(post_id:int, _: bool = Depends(general_rate_limit), user:User=Depends(get_current_user), db:Session=Depends(get_db)):
+async def delete_post(post_id:int, _: bool = Depends(general_rate_limit), user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
     if not user:
        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="you are not authorized")
     post = await get_post_from_post_id_svc(db,post_id)
@@ -62,33 +93,34 @@ async def delete_post(post_id:int, _: bool = Depends(general_rate_limit), user:U
   
 # like a post
 @router.post("/like",status_code=status.HTTP_204_NO_CONTENT)
-async def like_post(post_id:int, _: bool = Depends(general_rate_limit), user:User=Depends(get_current_user), db:Session=Depends(get_db)):
-    username=user.username
+async def like_post(post_id:int, _: bool = Depends(general_rate_limit), user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="Login before liking a post")
-    res,detail=await like_post_svc(db,post_id,username)
+    res,detail=await like_post_svc(db,post_id,user.id,user.username)
     if not res:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,detail=detail)
 
 # unlike a post
 @router.post("/unlike",status_code=status.HTTP_204_NO_CONTENT)
-async def unlike_post(post_id:int, _: bool = Depends(general_rate_limit), user:User=Depends(get_current_user), db:Session=Depends(get_db)):
-    username=user.username
+async def unlike_post(post_id:int, _: bool = Depends(general_rate_limit), user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="Login before unliking a post")
-    res,detail=await unlike_post_svc(db,post_id,username)
+    res,detail=await unlike_post_svc(db,post_id,user.id)
     if not res:
        raise HTTPException(status_code=status.HTTP_409_CONFLICT,detail=detail)
 
 # likes
-@router.get("/likes/{post_id}",response_model=list[User])
-async def liked_users(post_id:int, _: bool = Depends(api_rate_limit), db:Session=Depends(get_db)):
-    return await liked_users_post_svc(db,post_id)
+@router.get("/likes/{post_id}",response_model=Page[User])
+async def liked_users(post_id:int,limit:int=10,cursor:str=None, _: bool = Depends(api_rate_limit), db:AsyncSession=Depends(get_db)):
+    try:
+        return await liked_users_post_svc(db,post_id,limit,cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid cursor")
   
 # get post by post_id
 @router.get("/{post_id}",response_model=Post)
-async def get_post_by_id(post_id:int, _: bool = Depends(api_rate_limit), db:Session=Depends(get_db)):
-    post = await get_post_from_post_id_svc(db,post_id)
+async def get_post_by_id(post_id:int, _: bool = Depends(api_rate_limit), db:AsyncSession=Depends(get_db)):
+    post = await get_post_svc(db,post_id)
     if not post:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail="Post not found")
     return post
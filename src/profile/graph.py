@@ -0,0 +1,82 @@
+# In-process follow graph - sorted array adjacency per user, so "does A follow B" is a binary search
+from array import array
+from bisect import bisect_left, insort
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict
+from auth.models import Follow
+import sys
+import time
+
+class FollowGraph:
+    """follower id -> sorted array of followed ids, loaded from the follow table and updated on follow/unfollow"""
+    typecode = "q"  # 8 bytes per edge - a signed 64-bit slot, so ids past 2**31 cannot overflow it
+
+    def __init__(self):
+        self.following: Dict[int, array] = {}
+        self.loaded = False
+        self.edges = 0
+        self.load_seconds = 0.0
+
+    async def load(self, db: AsyncSession):
+        start = time.perf_counter()
+        following: Dict[int, array] = {}
+        edges = 0
+        # ordered by the primary key, so each adjacency list is built already sorted
+        rows = await db.stream(select(Follow.follower_id, Follow.following_id).order_by(Follow.follower_id, Follow.following_id))
+        async for follower_id, following_id in rows:
+            adjacency = following.get(follower_id)
+            if adjacency is None:
+                adjacency = following[follower_id] = array(self.typecode)
+            adjacency.append(following_id)
+            edges += 1
+        self.following = following
+        self.edges = edges
+        self.loaded = True
+        self.load_seconds = time.perf_counter() - start
+
+    def follows(self, follower_id: int, following_id: int) -> bool:
+        adjacency = self.following.get(follower_id)
+        if not adjacency:
+            return False
+        i = bisect_left(adjacency, following_id)
+        return i < len(adjacency) and adjacency[i] == following_id
+
+    def add(self, follower_id: int, following_id: int):
+        if self.follows(follower_id, following_id):
+            return
+        adjacency = self.following.get(follower_id)
+        if adjacency is None:
+            adjacency = self.following[follower_id] = array(self.typecode)
+        insort(adjacency, following_id)
+        self.edges += 1
+
+    def remove(self, follower_id: int, following_id: int):
+        adjacency = self.following.get(follower_id)
+        if not adjacency:
+            return
+        i = bisect_left(adjacency, following_id)
+        if i < len(adjacency) and adjacency[i] == following_id:
+            del adjacency[i]
+            self.edges -= 1
+            if not adjacency:
+                del self.following[follower_id]
+
+    def memory_bytes(self) -> int:
+        """Approximate footprint: the arrays plus the dict holding them"""
+        return sys.getsizeof(self.following) + sum(
+            sys.getsizeof(follower_id) + sys.getsizeof(adjacency) for follower_id, adjacency in self.following.items()
+        )
+
+    def stats(self) -> dict:
+        memory = self.memory_bytes()
+        return {
+            "loaded": self.loaded,
+            "users": len(self.following),
+            "edges": self.edges,
+            "memory_bytes": memory,
+            "bytes_per_million_edges": round(memory / self.edges * 1_000_000) if self.edges else 0,
+            "load_seconds": round(self.load_seconds, 3),
+        }
+
+follow_graph = FollowGraph()
@@ -5,6 +5,8 @@ from typing import Optional, List
 from auth.schemas import UserBase
 from auth.enums import Gender
 from security_utils import sanitizer
+from pagination import Page
+from config import settings
 
 class Profile(BaseModel):
     username:str = Field(..., min_length=3, max_length=30, pattern="^[a-zA-Z0-9_]+$")
@@ -45,13 +47,25 @@ class UserSchema(UserBase):  #for efficient frontend delivery
     class Config:
         from_attributes = True 
         
-class FollowingList(BaseModel):
-    following: List[UserSchema]=[]
-    class Config:
-        from_attributes = True 
+class FollowingList(Page[UserSchema]):
+    pass
     
-class FollowersList(BaseModel):
-    followers: List[UserSchema]=[]
-    class Config:
-        from_attributes = True 
-    
\ No newline at end of file
+class FollowersList(Page[UserSchema]):
+    pass
+    
+class Suggestion(BaseModel):
+    username: str
+    name: Optional[str] = None
+    profile_pic: Optional[str] = None
+    mutual_count: int  # estimated once the caller follows more accounts than the sampling threshold
+
+class RelationshipsRequest(BaseModel):
+    usernames: List[str] = Field(..., min_length=1, max_length=settings.relationships_max_usernames)
+
+class Relationship(BaseModel):
+    username: str
+    following: bool = False  # the caller follows this user
+    followed_by: bool = False  # this user follows the caller
+
+class Relationships(BaseModel):
+    relationships: List[Relationship] = []
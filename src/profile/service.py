@@ -1,11 +1,21 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import desc, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth.models import User,Follow
-from activity.models import Activity
-from .schemas import FollowersList,FollowingList,Profile
-from auth.service import existing_user,get_user_from_id
+from activity.writer import record_activity
+from .schemas import FollowersList,FollowingList,Profile,Relationships
+from auth.service import existing_user,invalidate_user_cache
+from post.timeline import backfill_timeline,prune_timeline
+from pagination import decode_cursor, keyset_before, page_limit, split_page
+from .graph import follow_graph
+from .suggestions import rank_friends_of_friends, sample_friends
+from cache import LRUCache
+from config import settings
+
+# ranked suggestions per user id, dropped when that user follows or unfollows someone
+suggestion_cache=LRUCache(maxsize=settings.suggestions_cache_size,ttl=settings.suggestions_cache_ttl)
 
 # follow
-async def follow_svc(db:Session,follower:str,following:str):
+async def follow_svc(db:AsyncSession,follower:str,following:str):
     db_follower=await existing_user(db,follower,"")
     db_following=await existing_user(db,following,"")
     if not db_follower or not db_following:
@@ -13,10 +23,10 @@ async def follow_svc(db:Session,follower:str,following:str):
     if db_follower.id == db_following.id:
        return False
      
-    db_follow=db.query(Follow).filter(
+    db_follow=await db.scalar(select(Follow).where(
         Follow.follower_id == db_follower.id,
         Follow.following_id == db_following.id
-    ).first()
+    ))
     
     if db_follow:
       return False
@@ -24,14 +34,18 @@ async def follow_svc(db:Session,follower:str,following:str):
     db.add(db_follow)
     db_follower.following_count += 1
     db_following.followers_count += 1
-    follow_activity=Activity(username=follower,followed_username=following,followed_user_pic=db_following.profile_pic)
-    db.add(follow_activity)
-    db.commit()
+    await backfill_timeline(db,db_follower.id,db_following.id,db_following.followers_count)
+    await db.commit()
+    invalidate_user_cache(db_follower.id,db_following.id)
+    suggestion_cache.pop(db_follower.id)
+    if follow_graph.loaded:
+      follow_graph.add(db_follower.id,db_following.id)
+    await record_activity(db,username=follower,followed_username=following,followed_user_pic=db_following.profile_pic)
     return {"message": "Successfully followed user"}
     
 
 # unfollow
-async def unfollow_svc(db:Session,follower:str,following:str):
+async def unfollow_svc(db:AsyncSession,follower:str,following:str):
     db_follower=await existing_user(db,follower,"")
     db_following=await existing_user(db,following,"")
     if not db_follower or not db_following:
@@ -39,62 +53,125 @@ async def unfollow_svc(db:Session,follower:str,following:str):
     if db_follower.id == db_following.id:
        return False
      
-    db_follow=db.query(Follow).filter(
+    db_follow=await db.scalar(select(Follow).where(
         Follow.follower_id == db_follower.id,
         Follow.following_id == db_following.id
-    ).first()
+    ))
     
     if not db_follow:
        return False
-    db.delete(db_follow)
+    await db.delete(db_follow)
     db_follower.following_count -= 1
     db_following.followers_count -= 1
-    db.commit()
+    await prune_timeline(db,db_follower.id,db_following.id)
+    await db.commit()
+    invalidate_user_cache(db_follower.id,db_following.id)
+    suggestion_cache.pop(db_follower.id)
+    if follow_graph.loaded:
+      follow_graph.remove(db_follower.id,db_following.id)
     return {"message": "Successfully unfollowed user"}
 
-# get followers
-async def get_followers_svc(db:Session,user_id:int,skip:int=0,limit:int=10)->FollowersList:
-    db_user= await get_user_from_id(db,user_id)
-    if not db_user:
-       return []
-    db_followers=db.query(Follow).filter_by(following_id=db_user.id).join(User,User.id==Follow.follower_id).offset(skip).limit(limit).all()    
-    followers=[]
-    for user in db_followers:
-        followers.append(
-          {
-            "username":user.follower.username,
-            "name":user.follower.name,
-            "profile_pic":user.follower.profile_pic,
-          }
-        )
-    return FollowersList(followers=followers)
+# one row per listed user, selecting only what the list shows - never lazy-load the User per Follow row
+def _follow_list_query(listed_id, owner_id, user_id:int, limit:int, cursor:str=None):
+    rows=select(User.username,User.name,User.profile_pic,listed_id).join(User,User.id==listed_id).where(
+      owner_id==user_id
+    ).order_by(desc(listed_id)).limit(limit+1)
+    if cursor:
+      rows=rows.where(keyset_before((listed_id,),decode_cursor(cursor,int)))
+    return rows
+
+# get followers - keyset paginated on follower id
+async def get_followers_svc(db:AsyncSession,user_id:int,limit:int=10,cursor:str=None)->FollowersList:
+    limit=page_limit(limit)
+    rows=await db.execute(_follow_list_query(Follow.follower_id,Follow.following_id,user_id,limit,cursor))
+    rows,next_cursor=split_page(rows.all(),limit,lambda row:(row.follower_id,))
+    return FollowersList(items=[row._mapping for row in rows],next_cursor=next_cursor)
         
 
-# get following
-async def get_following_svc(db:Session,user_id:int) ->FollowingList:
-    db_user= await get_user_from_id(db,user_id)
-    if not db_user:
-       return []
-    db_following=db.query(Follow).filter_by(follower_id=db_user.id).join(User,User.id==Follow.following_id).all()
-    following=[]
-    for user in db_following:
-        following.append(
-          {           
-            "username":user.following.username,
-            "name":user.following.name,
-            "profile_pic":user.following.profile_pic,
-          }
-        )
-    return FollowingList(following=following)
+# get following - keyset paginated on followed user id
+async def get_following_svc(db:AsyncSession,user_id:int,limit:int=10,cursor:str=None) ->FollowingList:
+    limit=page_limit(limit)
+    rows=await db.execute(_follow_list_query(Follow.following_id,Follow.follower_id,user_id,limit,cursor))
+    rows,next_cursor=split_page(rows.all(),limit,lambda row:(row.following_id,))
+    return FollowingList(items=[row._mapping for row in rows],next_cursor=next_cursor)
     
-# check follow activity
-async def check_follow_svc(db:Session,current_user:str,user:str):
-    db_follower=await existing_user(db,current_user,"")
-    db_following=await existing_user(db,user,"")
-    
-    if not db_follower or not db_following:
-       return False
-    db_following=db.query(Follow).filter(Follow.follower_id==db_follower.id,Follow.following_id==db_following.id).first()
-    if db_following:
-        return True
-    return False
\ No newline at end of file
+# does follower_id follow following_id - a binary search in the in-process graph when it is loaded
+async def is_following(db:AsyncSession,follower_id:int,following_id:int)->bool:
+    if follow_graph.loaded and follow_graph.follows(follower_id,following_id):
+       return True
+    # each worker holds its own graph, so a follow made through another process is only in the table
+    follows=await db.scalar(select(Follow.follower_id).where(
+        Follow.follower_id==follower_id,Follow.following_id==following_id
+    )) is not None
+    if follows and follow_graph.loaded:
+       follow_graph.add(follower_id,following_id)
+    return follows
+
+# follow flags between the caller and each listed user - one IN query per direction
+async def get_relationships_svc(db:AsyncSession,user_id:int,usernames:list)->Relationships:
+    usernames=list(dict.fromkeys(usernames))
+    following=set(await db.scalars(select(User.username).join(Follow,Follow.following_id==User.id).where(
+      Follow.follower_id==user_id,User.username.in_(usernames)
+    )))
+    followed_by=set(await db.scalars(select(User.username).join(Follow,Follow.follower_id==User.id).where(
+      Follow.following_id==user_id,User.username.in_(usernames)
+    )))
+    return Relationships(relationships=[
+      {"username":username,"following":username in following,"followed_by":username in followed_by}
+      for username in usernames
+    ])
+
+# people you may know - accounts followed by the people you follow, ranked by mutual connections
+async def get_suggestions_svc(db:AsyncSession,user_id:int,limit:int=10)->list:
+    suggestions=suggestion_cache.get(user_id)
+    if suggestions is None:
+      if follow_graph.loaded:
+        following=follow_graph.following.get(user_id,())
+        ranked=rank_friends_of_friends(
+          user_id,following,lambda friend_id:follow_graph.following.get(friend_id,()),settings.suggestions_max_results,
+          settings.suggestions_max_friends,settings.suggestions_max_per_friend,
+        )
+      else:
+        following=(await db.scalars(select(Follow.following_id).where(Follow.follower_id==user_id))).all()
+        # one draw of friends: the same sample is fetched and ranked, so its weight matches the edges walked
+        friends,weight=sample_friends(following,settings.suggestions_max_friends)
+        adjacency,degrees=await _sampled_adjacency(db,friends)
+        ranked=rank_friends_of_friends(
+          user_id,following,lambda friend_id:adjacency.get(friend_id,()),settings.suggestions_max_results,
+          settings.suggestions_max_friends,settings.suggestions_max_per_friend,
+          sampled=(friends,weight),degree=lambda friend_id:degrees.get(friend_id,0),
+        )
+      users={row.id:row for row in await db.execute(
+        select(User.id,User.username,User.name,User.profile_pic).where(User.id.in_([candidate for candidate,_ in ranked]))
+      )}
+      suggestions=[
+        {"username":users[candidate].username,"name":users[candidate].name,"profile_pic":users[candidate].profile_pic,"mutual_count":mutual}
+        for candidate,mutual in ranked if candidate in users
+      ]
+      suggestion_cache.set(user_id,suggestions)
+    return suggestions[:max(limit,1)]
+
+# branches per UNION ALL statement, well under sqlite's default limit of 500 compound terms
+_ADJACENCY_CHUNK=100
+
+# without the in-memory graph: the sampled friends' follows, at most max_per_friend each
+async def _sampled_adjacency(db:AsyncSession,friends:list):
+    """(friend id -> followed ids, friend id -> full out-degree for friends whose list hit the cap)"""
+    cap=settings.suggestions_max_per_friend
+    adjacency={}
+    for start in range(0,len(friends),_ADJACENCY_CHUNK):
+      # a LIMIT per friend, so each branch stops after `cap` entries of the primary key's range;
+      # the newest follows stand in for the random per-friend sample the graph path takes
+      branches=[
+        select(Follow.follower_id,Follow.following_id).where(Follow.follower_id==friend_id)
+        .order_by(desc(Follow.following_id)).limit(cap).subquery()
+        for friend_id in friends[start:start+_ADJACENCY_CHUNK]
+      ]
+      rows=await db.execute(union_all(*[select(branch.c.follower_id,branch.c.following_id) for branch in branches]))
+      for friend_id,followed_id in rows:
+        adjacency.setdefault(friend_id,[]).append(followed_id)
+    capped=[friend_id for friend_id,followed in adjacency.items() if len(followed)>=cap]
+    degrees={}
+    if capped:
+      degrees=dict((await db.execute(select(User.id,User.following_count).where(User.id.in_(capped)))).all())
+    return adjacency,degrees
@@ -0,0 +1,50 @@
+# "People you may know" - friends-of-friends ranked by (estimated) mutual connections
+from operator import itemgetter
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+import heapq
+import random
+
+def sample_friends(following: Sequence[int], max_friends: int, rng: random.Random = random) -> Tuple[List[int], float]:
+    """At most max_friends of the accounts followed, uniformly, with the weight that scales their hits back up"""
+    friends = list(following)
+    if len(friends) <= max_friends:
+        return friends, 1.0
+    return rng.sample(friends, max_friends), len(friends) / max_friends
+
+def rank_friends_of_friends(
+    user_id: int,
+    following: Sequence[int],
+    adjacency: Callable[[int], Sequence[int]],
+    k: int,
+    max_friends: int,
+    max_per_friend: int,
+    rng: random.Random = random,
+    sampled: Optional[Tuple[Sequence[int], float]] = None,
+    degree: Optional[Callable[[int], int]] = None,
+) -> List[Tuple[int, int]]:
+    """Top-k (candidate id, mutual count) among accounts followed by the accounts user_id follows
+
+    Work is bounded by max_friends * max_per_friend: above either threshold a uniform sample is
+    walked instead and each hit is weighted up, so the counts are unbiased estimates.
+    Callers that fetch edges per friend pass the (friends, weight) they already drew with
+    sample_friends as `sampled`, and `degree` when adjacency returns a capped list, so the
+    estimate scales by each friend's full out-degree.
+    """
+    exclude = set(following)
+    exclude.add(user_id)
+    friends, friend_weight = sampled if sampled is not None else sample_friends(following, max_friends, rng)
+
+    scores = {}
+    for friend_id in friends:
+        theirs: Iterable[int] = adjacency(friend_id)
+        weight = friend_weight
+        if len(theirs) > max_per_friend:
+            weight *= len(theirs) / max_per_friend
+            theirs = rng.sample(theirs, max_per_friend)
+        elif degree is not None and theirs and degree(friend_id) > len(theirs):
+            weight *= degree(friend_id) / len(theirs)
+        for candidate in theirs:
+            if candidate not in exclude:
+                scores[candidate] = scores.get(candidate, 0) + weight
+    # a k-sized heap instead of sorting every candidate
+    return [(candidate, round(score)) for candidate, score in heapq.nlargest(k, scores.items(), key=itemgetter(1))]
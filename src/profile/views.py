@@ -1,16 +1,17 @@
 from fastapi import APIRouter,status,Depends,HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import get_db
-from .schemas import Profile,FollowingList,FollowersList
-from .service import follow_svc,unfollow_svc,get_followers_svc,get_following_svc,check_follow_svc
-from auth.schemas import User
+from .schemas import Profile,FollowingList,FollowersList,Suggestion,RelationshipsRequest,Relationships
+from .service import follow_svc,unfollow_svc,get_followers_svc,get_following_svc,is_following,get_suggestions_svc,get_relationships_svc
+from auth.schemas import UserPrincipal
 from auth.service import existing_user, get_current_user
 from rate_limiter import general_rate_limit, api_rate_limit
+from pagination import InvalidCursor
 
 router = APIRouter(prefix="/profile",tags=["Profile"])
 
 @router.get("/user/{username}",response_model=Profile)
-async def profile(username:str, _: bool = Depends(api_rate_limit), db:Session=Depends(get_db)):
+async def profile(username:str, _: bool = Depends(api_rate_limit), db:AsyncSession=Depends(get_db)):
     db_user=await existing_user(db,username,"")
     if not db_user:
        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,detail="User not found")
@@ -18,7 +19,7 @@ async def profile(username:str, _: bool = Depends(api_rate_limit), db:Session=De
     return profile
   
 @router.post("/follow/{username}",status_code=status.HTTP_204_NO_CONTENT)
-async def follow(username:str, _: bool = Depends(general_rate_limit), db_user:User=Depends(get_current_user), db:Session=Depends(get_db)):
+async def follow(username:str, _: bool = Depends(general_rate_limit), db_user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
     if not db_user:
        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="Not authenticated")
     res=await follow_svc(db,db_user.username,username)
@@ -26,7 +27,7 @@ async def follow(username:str, _: bool = Depends(general_rate_limit), db_user:Us
        raise HTTPException(status_code=status.HTTP_409_CONFLICT,detail="could not follow")
      
 @router.post("/unfollow/{username}",status_code=status.HTTP_204_NO_CONTENT)
-async def unfollow(username:str, _: bool = Depends(general_rate_limit), db_user:User=Depends(get_current_user), db:Session=Depends(get_db)):
+async def unfollow(username:str, _: bool = Depends(general_rate_limit), db_user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
     if not db_user:
        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="Not authenticated")
     res=await unfollow_svc(db,db_user.username,username)
@@ -34,46 +35,63 @@ async def unfollow(username:str, _: bool = Depends(general_rate_limit), db_user:
     if not res:
        raise HTTPException(status_code=status.HTTP_409_CONFLICT,detail="could not unfollow")
 
+# follow status for a whole list of users at once (likers, followers pages, search results)
+@router.post("/relationships",response_model=Relationships)
+async def get_relationships(request:RelationshipsRequest, _: bool = Depends(api_rate_limit), current_user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
+    if not current_user:
+       raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="Invalid token")
+    return await get_relationships_svc(db,current_user.id,request.usernames)
+
+# people you may know
+@router.get("/suggestions",response_model=list[Suggestion])
+async def get_suggestions(limit:int=10, _: bool = Depends(api_rate_limit), current_user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
+    if not current_user:
+       raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="Invalid token")
+    return await get_suggestions_svc(db,current_user.id,limit)
+
 # get followers     
 @router.get("/followers",response_model=FollowersList)
-async def get_followers(_: bool = Depends(api_rate_limit), current_user:User=Depends(get_current_user), db:Session=Depends(get_db)):
+async def get_followers(limit:int=10,cursor:str=None, _: bool = Depends(api_rate_limit), current_user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
     if not current_user:
        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="Invalid token")
-    return await get_followers_svc(db,current_user.id)
+    try:
+        return await get_followers_svc(db,current_user.id,limit,cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid cursor")
      
 # get following
 @router.get("/following",response_model=FollowingList)
-async def get_following(_: bool = Depends(api_rate_limit), current_user:User=Depends(get_current_user), db:Session=Depends(get_db)):
+async def get_following(limit:int=10,cursor:str=None, _: bool = Depends(api_rate_limit), current_user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
     if not current_user:
        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="Invalid token")
-    return await get_following_svc(db,current_user.id)
+    try:
+        return await get_following_svc(db,current_user.id,limit,cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid cursor")
  
 # get following by username
 @router.get("/following/{username}",response_model=FollowingList)
-async def get_following_by_username(username:str, _: bool = Depends(api_rate_limit), current_user:User=Depends(get_current_user), db:Session=Depends(get_db)):
-    if current_user == username:
-       return await get_following_svc(db,current_user.id)
-    following_activity = await check_follow_svc(db,current_user.username,username)
+async def get_following_by_username(username:str,limit:int=10,cursor:str=None, _: bool = Depends(api_rate_limit), current_user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
+    if not current_user:
+       raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="Invalid token")
     target_user = await existing_user(db, username, "")
-    if not following_activity:
+    if not target_user or (target_user.id != current_user.id and not await is_following(db, current_user.id, target_user.id)):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not followed or your follower")
-    return await get_following_svc(db, target_user.id)
+    try:
+        return await get_following_svc(db, target_user.id,limit,cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid cursor")
  
 
 #get followers by username
 @router.get("/followers/{username}",response_model=FollowersList)
-async def get_followers_by_username(username:str, _: bool = Depends(api_rate_limit), current_user:User=Depends(get_current_user), db:Session=Depends(get_db)):
-    if current_user == username:
-       return await get_followers_svc(db,current_user.id)
-    following_activity = await check_follow_svc(db,current_user.username,username)
+async def get_followers_by_username(username:str,limit:int=10,cursor:str=None, _: bool = Depends(api_rate_limit), current_user:UserPrincipal=Depends(get_current_user), db:AsyncSession=Depends(get_db)):
+    if not current_user:
+       raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,detail="Invalid token")
     target_user = await existing_user(db, username, "")
-    if not following_activity:
+    if not target_user or (target_user.id != current_user.id and not await is_following(db, current_user.id, target_user.id)):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not mutually following")
-    return await get_followers_svc(db, target_user.id)  
- 
- 
-    
-    
-    
-    
-    
\ No newline at end of file
+    try:
+        return await get_followers_svc(db, target_user.id,limit,cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,detail="Invalid cursor")  
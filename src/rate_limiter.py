@@ -1,22 +1,28 @@
 # Efficient in-memory rate limiter - no external dependencies
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
 from fastapi import HTTPException, Request
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from config import settings
 import asyncio
+import ipaddress
 import time
 
 class TokenBucket:
     """Token bucket algorithm for rate limiting"""
+    # slots instead of a per-instance __dict__ - one of these is kept per (tier, client)
+    __slots__ = ("capacity", "tokens", "refill_rate", "last_refill")
+
     def __init__(self, capacity: int, refill_rate: float):
         self.capacity = capacity  # Maximum tokens
         self.tokens = capacity    # Current tokens
         self.refill_rate = refill_rate  # Tokens per second
-        self.last_refill = time.time()
+        self.last_refill = time.monotonic()  # monotonic, so wall-clock jumps cannot refill or drain a bucket
     
     def consume(self, tokens: int = 1) -> bool:
         """Try to consume tokens, return True if successful"""
-        now = time.time()
+        now = time.monotonic()
         # Add tokens based on time elapsed
         time_passed = now - self.last_refill
         self.tokens = min(self.capacity, self.tokens + time_passed * self.refill_rate)
@@ -27,62 +33,151 @@ class TokenBucket:
             return True
         return False
 
+class CountMinSketch:
+    """Fixed-size request counts for clients without a bucket - estimates only ever overcount"""
+    def __init__(self, width: int, depth: int):
+        self.width = width
+        self.rows = [array("I", [0]) * width for _ in range(depth)]
+
+    def add(self, key: str) -> int:
+        """Count one request for key and return its estimated total"""
+        estimate = None
+        for seed, row in enumerate(self.rows):
+            i = hash((seed, key)) % self.width
+            row[i] += 1
+            estimate = row[i] if estimate is None else min(estimate, row[i])
+        return estimate
+
+    def clear(self):
+        for row in self.rows:
+            row[:] = array("I", [0]) * self.width
+
 class SimpleRateLimiter:
-    def __init__(self):
-        # Store token buckets per IP
-        self.buckets: Dict[str, TokenBucket] = {}
-        self.last_cleanup = time.time()
-        self.cleanup_interval = 300  # Clean every 5 minutes
+    def __init__(self, max_clients: int = 0, sketch_width: int = 4096, sketch_depth: int = 4, trusted_proxies: Iterable[str] = ()):
+        # Store token buckets per tier, then per client IP - each tier keeps its own capacity and refill rate
+        # (nested rather than (tier, ip) tuple keys, which would cost a tuple per tracked client).
+        # Each tier's clients are kept least recently used first, so idle ones are trimmed from the front.
+        self.buckets: Dict[str, "OrderedDict[str, TokenBucket]"] = defaultdict(OrderedDict)
+        self.max_clients = max_clients  # per tier, 0 for unbounded
+        self.sketch_width = sketch_width
+        self.sketch_depth = sketch_depth
+        # tier -> (sketch, window start) counting requests from clients past the cap, reset every window
+        self.sketches: Dict[str, Tuple[CountMinSketch, float]] = {}
+        self.trusted_proxies = [ipaddress.ip_network(proxy, strict=False) for proxy in trusted_proxies]
+        self.evictions = 0
+        self.sketch_checks = 0
+        self.sketch_limited = 0
+        self.idle_seconds = 3600  # buckets unused this long are dropped
     
     def cleanup_old_buckets(self):
-        """Prevent memory leaks by removing old buckets"""
-        now = time.time()
-        if now - self.last_cleanup > self.cleanup_interval:
-            # Remove buckets that haven't been used for 1 hour
-            cutoff_time = now - 3600
-            self.buckets = {
-                ip: bucket for ip, bucket in self.buckets.items()
-                if bucket.last_refill > cutoff_time
-            }
-            self.last_cleanup = now
+        """Prevent memory leaks by removing buckets unused for idle_seconds"""
+        cutoff_time = time.monotonic() - self.idle_seconds
+        for clients in self.buckets.values():
+            self._trim(clients, cutoff_time)
+
+    def _trim(self, clients: "OrderedDict[str, TokenBucket]", cutoff_time: float):
+        # least recently used first - stop at the first bucket still in use, so this is O(removed)
+        while clients and next(iter(clients.values())).last_refill < cutoff_time:
+            clients.popitem(last=False)
     
+    def _trusted(self, host: Optional[str]) -> bool:
+        if not host or not self.trusted_proxies:
+            return False
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return any(address in network for network in self.trusted_proxies)
+
     def get_client_ip(self, request: Request) -> str:
         """Extract client IP from request, handling proxies"""
-        # Check for forwarded headers (common in production with proxies)
+        peer = request.client.host if request.client else "unknown"
+        # forwarded headers are only believed when a trusted proxy sent them - otherwise any client
+        # could pick a fresh address per request and get a fresh bucket each time
+        if not self._trusted(peer):
+            return peer
+
         forwarded_for = request.headers.get("X-Forwarded-For")
         if forwarded_for:
-            return forwarded_for.split(',')[0].strip()
+            # proxies append, so walk back from the nearest hop to the first address we do not trust
+            hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+            for hop in reversed(hops):
+                if not self._trusted(hop):
+                    return hop
+            return hops[0] if hops else peer
         
         real_ip = request.headers.get("X-Real-IP")
         if real_ip:
-            return real_ip
+            return real_ip.strip()
         
-        # Fallback to direct client IP
-        return request.client.host if request.client else "unknown"
+        return peer
     
+    def hit(self, tier: str, client: str, max_requests: int, window_seconds: int) -> Optional[TokenBucket]:
+        """Take one token from the client's bucket for this tier, returning the bucket when it is empty
+
+        Past max_clients a new client only gets a bucket if the least recently used one is idle enough
+        to have refilled completely; otherwise it is counted in the tier's count-min sketch instead.
+        """
+        clients = self.buckets[tier]
+        bucket = clients.get(client)
+        if bucket is not None:
+            clients.move_to_end(client)
+        else:
+            now = time.monotonic()
+            self._trim(clients, now - self.idle_seconds)
+            if self.max_clients and len(clients) >= self.max_clients:
+                oldest = next(iter(clients.values()))
+                # a full bucket carries no state, so dropping it changes no decision
+                if (now - oldest.last_refill) * oldest.refill_rate < oldest.capacity:
+                    return self._sketch_hit(tier, client, max_requests, window_seconds, now)
+                clients.popitem(last=False)
+                self.evictions += 1
+            # Refill rate: max_requests per window_seconds
+            bucket = clients[client] = TokenBucket(max_requests, max_requests / window_seconds)
+        return None if bucket.consume(1) else bucket
+
+    def _sketch_hit(self, tier: str, client: str, max_requests: int, window_seconds: int, now: float) -> Optional[TokenBucket]:
+        # fixed windows rather than refill: the sketch has counters, not per-client timestamps
+        sketch, window_start = self.sketches.get(tier) or (CountMinSketch(self.sketch_width, self.sketch_depth), now)
+        if now - window_start >= window_seconds:
+            sketch.clear()
+            window_start = now
+        self.sketches[tier] = (sketch, window_start)
+        self.sketch_checks += 1
+        if sketch.add(client) <= max_requests:
+            return None
+        self.sketch_limited += 1
+        # an empty stand-in bucket so the caller reports the tier's retry-after like any other
+        limited = TokenBucket(max_requests, max_requests / window_seconds)
+        limited.tokens = 0
+        return limited
+
+    def stats(self) -> dict:
+        return {
+            "max_clients": self.max_clients,
+            "tracked": {tier: len(clients) for tier, clients in self.buckets.items()},
+            "evictions": self.evictions,
+            "sketch_checks": self.sketch_checks,
+            "sketch_limited": self.sketch_limited,
+            "sketch_bytes": sum(sum(row.itemsize * len(row) for row in sketch.rows) for sketch, _ in self.sketches.values()),
+        }
+
     async def check_rate_limit(
         self, 
         request: Request, 
         max_requests: int = 10, 
-        window_seconds: int = 60
+        window_seconds: int = 60,
+        tier: Optional[str] = None,
     ) -> bool:
         """
         Check if request should be rate limited using token bucket algorithm returns true if request allowed, raises HTTPException if rate limited
         """
-        # Cleanup old buckets periodically
-        self.cleanup_old_buckets()
-        
         client_ip = self.get_client_ip(request)
+        # callers without a tier name still get a bucket of their own limits
+        tier = tier or f"{max_requests}/{window_seconds}"
         
-        # Create bucket if doesn't exist
-        if client_ip not in self.buckets:
-            # Refill rate: max_requests per window_seconds
-            refill_rate = max_requests / window_seconds
-            self.buckets[client_ip] = TokenBucket(max_requests, refill_rate)
-        
-        bucket = self.buckets[client_ip]
-        
-        if not bucket.consume(1):
+        bucket = self.hit(tier, client_ip, max_requests, window_seconds)
+        if bucket is not None:
             # Calculate retry after time
             tokens_needed = 1
             retry_after = int(tokens_needed / bucket.refill_rate)
@@ -99,28 +194,31 @@ class SimpleRateLimiter:
         
         return True
 
-rate_limiter = SimpleRateLimiter()
+rate_limiter = SimpleRateLimiter(
+    settings.rate_limit_max_clients, settings.rate_limit_sketch_width,
+    settings.rate_limit_sketch_depth, settings.trusted_proxies,
+)
 
 # Dependency functions for FastAPI
 async def auth_rate_limit(request: Request):
     """Strict rate limiting for authentication endpoints (5 requests per minute)"""
-    return await rate_limiter.check_rate_limit(request, max_requests=5, window_seconds=60)
+    return await rate_limiter.check_rate_limit(request, max_requests=5, window_seconds=60, tier="auth")
 
 async def general_rate_limit(request: Request):
     """General rate limiting for most endpoints (30 requests per minute)"""
-    return await rate_limiter.check_rate_limit(request, max_requests=30, window_seconds=60)
+    return await rate_limiter.check_rate_limit(request, max_requests=30, window_seconds=60, tier="general")
 
 async def strict_rate_limit(request: Request):
     """Very strict rate limiting for sensitive operations (3 requests per minute)"""
-    return await rate_limiter.check_rate_limit(request, max_requests=3, window_seconds=60)
+    return await rate_limiter.check_rate_limit(request, max_requests=3, window_seconds=60, tier="strict")
 
 async def api_rate_limit(request: Request):
     """API rate limiting for high-frequency endpoints (100 requests per minute)"""
-    return await rate_limiter.check_rate_limit(request, max_requests=100, window_seconds=60)
+    return await rate_limiter.check_rate_limit(request, max_requests=100, window_seconds=60, tier="api")
 
 async def moderate_rate_limit(request: Request):
     """Moderate rate limiting for regular operations (15 requests per minute)"""
-    return await rate_limiter.check_rate_limit(request, max_requests=15, window_seconds=60)
+    return await rate_limiter.check_rate_limit(request, max_requests=15, window_seconds=60, tier="moderate")
 
 # For testing purposes
 simple_rate_limiter = rate_limiter
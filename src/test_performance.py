@@ -0,0 +1,328 @@
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import create_engine, desc, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from auth.models import User, Follow
+from post.models import Post
+
+
+# In-process benchmarks - no running server needed, everything hits a throwaway sqlite file
+class PerformanceBenchmark:
+    def __init__(self, num_users=50, num_posts=2000):
+        self.num_users = num_users
+        self.num_posts = num_posts
+        self.db_path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+        self.sync_engine = create_engine(f"sqlite:///{self.db_path}")
+        self.async_engine = create_async_engine(f"sqlite+aiosqlite:///{self.db_path}")
+        self.SyncSession = sessionmaker(bind=self.sync_engine, autoflush=False)
+        self.AsyncSession = async_sessionmaker(bind=self.async_engine, autoflush=False, expire_on_commit=False)
+        self.seed()
+
+    def print_header(self, title):
+        print(f"\n{'='*60}")
+        print(f"{title}")
+        print(f"{'='*60}")
+
+    def seed(self):
+        Base.metadata.create_all(bind=self.sync_engine)
+        with self.sync_engine.begin() as conn:
+            conn.execute(insert(User), [
+                {"email": f"user{i}@example.com", "username": f"user{i}", "name": f"User {i}", "hashed_password": "x"}
+                for i in range(1, self.num_users + 1)
+            ])
+            conn.execute(insert(Post), [
+                {"content": f"post number {i} #bench", "author_id": i % self.num_users + 1, "likes_count": 0}
+                for i in range(1, self.num_posts + 1)
+            ])
+
+    def feed_query(self, limit=10):
+        return select(Post, User.username).join(User).order_by(desc(Post.created_at)).limit(limit)
+
+    async def measure_concurrency(self, handler, concurrency, requests_per_worker):
+        """Run `concurrency` workers against handler while a heartbeat measures event loop stalls"""
+        loop_lag = []
+        done = asyncio.Event()
+
+        async def heartbeat(interval=0.005):
+            while not done.is_set():
+                start = time.perf_counter()
+                await asyncio.sleep(interval)
+                loop_lag.append(time.perf_counter() - start - interval)
+
+        async def worker():
+            for _ in range(requests_per_worker):
+                await handler()
+
+        beat = asyncio.create_task(heartbeat())
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await beat
+
+        total = concurrency * requests_per_worker
+        return {
+            "requests": total,
+            "throughput": total / elapsed,
+            "max_loop_lag_ms": max(loop_lag, default=0) * 1000,
+            "mean_loop_lag_ms": (statistics.mean(loop_lag) if loop_lag else 0) * 1000,
+        }
+
+    # 1. Sync Session inside coroutines (old path) vs AsyncSession (new path)
+    async def async_db_benchmark(self, concurrency=50, requests_per_worker=20):
+        self.print_header("ASYNC DATABASE LAYER")
+        print(f"{concurrency} concurrent workers, {requests_per_worker} feed queries each")
+
+        async def sync_handler():
+            with self.SyncSession() as db:
+                db.execute(self.feed_query()).all()
+
+        async def async_handler():
+            async with self.AsyncSession() as db:
+                (await db.execute(self.feed_query())).all()
+
+        results = {
+            "sync Session (old)": await self.measure_concurrency(sync_handler, concurrency, requests_per_worker),
+            "AsyncSession (new)": await self.measure_concurrency(async_handler, concurrency, requests_per_worker),
+        }
+        print(f"{'path':<22}{'req/s':>10}{'max loop lag':>16}{'mean loop lag':>16}")
+        for name, result in results.items():
+            print(f"{name:<22}{result['throughput']:>10.1f}{result['max_loop_lag_ms']:>13.2f} ms{result['mean_loop_lag_ms']:>13.2f} ms")
+        return results
+
+    def percentile(self, samples, pct):
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def seed_followers(self, author_id, num_followers):
+        first_id = self.num_users + 1
+        with self.sync_engine.begin() as conn:
+            conn.execute(insert(User), [
+                {"email": f"fan{i}@example.com", "username": f"fan{i}", "name": f"Fan {i}", "hashed_password": "x"}
+                for i in range(first_id, first_id + num_followers)
+            ])
+            conn.execute(insert(Follow), [
+                {"follower_id": i, "following_id": author_id} for i in range(first_id, first_id + num_followers)
+            ])
+            conn.execute(User.__table__.update().where(User.id == author_id).values(followers_count=num_followers))
+
+    # 2. Post creation latency for a heavily followed author - fan-out on write vs pull on read
+    async def hybrid_timeline_benchmark(self, num_followers=5000, num_posts=100):
+        self.print_header("HYBRID PUSH/PULL TIMELINE")
+        print(f"Author with {num_followers} followers creating {num_posts} posts per mode")
+        from config import settings
+        from post.schemas import PostCreate
+        from post.service import create_post_svc
+
+        author_id = 1
+        self.seed_followers(author_id, num_followers)
+        threshold = settings.celebrity_follower_threshold
+        modes = {"fan-out (push)": num_followers + 1, "merge on read (pull)": num_followers}
+        results = {}
+        try:
+            for name, mode_threshold in modes.items():
+                settings.celebrity_follower_threshold = mode_threshold
+                latencies = []
+                async with self.AsyncSession() as db:
+                    for i in range(num_posts):
+                        start = time.perf_counter()
+                        await create_post_svc(db, PostCreate(content=f"{name} post {i}"), author_id)
+                        latencies.append(time.perf_counter() - start)
+                results[name] = {
+                    "p50_ms": self.percentile(latencies, 50) * 1000,
+                    "p99_ms": self.percentile(latencies, 99) * 1000,
+                }
+        finally:
+            settings.celebrity_follower_threshold = threshold
+        print(f"{'mode':<24}{'p50':>12}{'p99':>12}")
+        for name, result in results.items():
+            print(f"{name:<24}{result['p50_ms']:>9.2f} ms{result['p99_ms']:>9.2f} ms")
+        return results
+
+    # 3. Follow graph index - memory per million edges and cost of a relationship check
+    def follow_graph_benchmark(self, num_users=20000, follows_per_user=50, lookups=200000):
+        self.print_header("IN-MEMORY FOLLOW GRAPH")
+        import random
+        from array import array
+        from profile.graph import FollowGraph
+
+        rng = random.Random(7)
+        graph = FollowGraph()
+        for follower_id in range(1, num_users + 1):
+            graph.following[follower_id] = array(graph.typecode, sorted(rng.sample(range(1, num_users + 1), follows_per_user)))
+        graph.edges = num_users * follows_per_user
+        graph.loaded = True
+
+        pairs = [(rng.randint(1, num_users), rng.randint(1, num_users)) for _ in range(lookups)]
+        start = time.perf_counter()
+        for follower_id, following_id in pairs:
+            graph.follows(follower_id, following_id)
+        per_lookup = (time.perf_counter() - start) / lookups
+
+        stats = graph.stats()
+        print(f"{stats['edges']} edges across {stats['users']} users")
+        print(f"memory:            {stats['memory_bytes'] / 1e6:.1f} MB")
+        print(f"per million edges: {stats['bytes_per_million_edges'] / 1e6:.1f} MB")
+        print(f"follows() lookup:  {per_lookup * 1e9:.0f} ns")
+        return {**stats, "lookup_ns": per_lookup * 1e9}
+
+    def power_law_graph(self, rng, num_users, mean_follows):
+        """follower id -> sorted array of followed ids, with Zipf-like out-degree and popularity"""
+        from array import array
+
+        # a few accounts follow thousands, a few are followed by most of the graph
+        popularity = [1 / rank ** 1.1 for rank in range(1, num_users + 1)]
+        following = {}
+        for user_id in range(1, num_users + 1):
+            degree = min(int(rng.paretovariate(1.2) * mean_follows / 6), 5000)
+            targets = set(rng.choices(range(1, num_users + 1), weights=popularity, k=degree)) if degree else set()
+            targets.discard(user_id)
+            following[user_id] = array("i", sorted(targets))
+        return following
+
+    def suggestion_users(self, rng, following, samples):
+        """The heaviest followers plus a uniform sample, so p99 sees the worst case"""
+        heavy = sorted(following, key=lambda u: len(following[u]), reverse=True)[:samples // 10]
+        return heavy + rng.sample(range(1, len(following) + 1), samples - len(heavy))
+
+    def report_latencies(self, latencies, p50_target_ms, p99_target_ms):
+        p50, p99 = self.percentile(latencies, 50) * 1000, self.percentile(latencies, 99) * 1000
+        passed = p50 <= p50_target_ms and p99 <= p99_target_ms
+        print(f"p50 {p50:.2f} ms (target {p50_target_ms} ms)   p99 {p99:.2f} ms (target {p99_target_ms} ms)")
+        print("PASS" if passed else "FAIL - suggestions are over their latency budget")
+        return {"p50_ms": p50, "p99_ms": p99, "passed": passed}
+
+    # 4. Friends-of-friends suggestions on a synthetic power-law follow graph
+    def suggestions_benchmark(self, num_users=50000, mean_follows=30, samples=300, p50_target_ms=10, p99_target_ms=50):
+        self.print_header("FOLLOW SUGGESTIONS (POWER-LAW GRAPH)")
+        import random
+        from config import settings
+        from profile.suggestions import rank_friends_of_friends
+
+        rng = random.Random(11)
+        following = self.power_law_graph(rng, num_users, mean_follows)
+        edges = sum(len(a) for a in following.values())
+        print(f"{num_users} users, {edges} edges, max out-degree {max(len(a) for a in following.values())}")
+
+        latencies = []
+        for user_id in self.suggestion_users(rng, following, samples):
+            start = time.perf_counter()
+            rank_friends_of_friends(
+                user_id, following[user_id], lambda f: following.get(f, ()), settings.suggestions_max_results,
+                settings.suggestions_max_friends, settings.suggestions_max_per_friend, rng,
+            )
+            latencies.append(time.perf_counter() - start)
+        return self.report_latencies(latencies, p50_target_ms, p99_target_ms)
+
+    # 4b. The same suggestions without the in-memory graph - the per-friend LIMIT queries against sqlite
+    async def suggestions_sql_benchmark(self, num_users=50000, mean_follows=30, samples=300, p50_target_ms=10, p99_target_ms=50):
+        self.print_header("FOLLOW SUGGESTIONS (SQL, NO GRAPH INDEX)")
+        import random
+        from profile.graph import follow_graph
+        from profile.service import get_suggestions_svc, suggestion_cache
+
+        rng = random.Random(11)
+        following = self.power_law_graph(rng, num_users, mean_follows)
+        engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'suggestions.db')}")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(insert(User), [
+                {"email": f"user{i}@example.com", "username": f"user{i}", "name": f"User {i}", "hashed_password": "x",
+                 "following_count": len(following[i])}
+                for i in range(1, num_users + 1)
+            ])
+            conn.execute(insert(Follow), [
+                {"follower_id": follower_id, "following_id": following_id}
+                for follower_id, adjacency in following.items() for following_id in adjacency
+            ])
+        engine.dispose()
+        print(f"{num_users} users, {sum(len(a) for a in following.values())} follow rows")
+
+        async_engine = create_async_engine(str(engine.url).replace("sqlite://", "sqlite+aiosqlite://", 1))
+        AsyncSession = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+        assert not follow_graph.loaded
+        latencies = []
+        async with AsyncSession() as db:
+            for user_id in self.suggestion_users(rng, following, samples):
+                suggestion_cache.pop(user_id)
+                start = time.perf_counter()
+                await get_suggestions_svc(db, user_id)
+                latencies.append(time.perf_counter() - start)
+        await async_engine.dispose()
+        return self.report_latencies(latencies, p50_target_ms, p99_target_ms)
+
+    # 5. Rate limiter - cost of one check and memory per tracked client
+    def rate_limiter_benchmark(self, num_clients=100000, checks=500000):
+        self.print_header("RATE LIMITER BUCKETS")
+        import random
+        import tracemalloc
+        from rate_limiter import SimpleRateLimiter
+
+        rng = random.Random(5)
+        clients = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(num_clients)]
+        limiter = SimpleRateLimiter()
+        # the client strings exist before tracing, as they would as request attributes
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for client in clients:
+            limiter.hit("api", client, 100, 60)
+        per_client = (tracemalloc.get_traced_memory()[0] - before) / num_clients
+        tracemalloc.stop()
+
+        picks = [rng.choice(clients) for _ in range(checks)]
+        start = time.perf_counter()
+        for client in picks:
+            limiter.hit("api", client, 100, 60)
+        per_check = (time.perf_counter() - start) / checks
+
+        # a spoofed-address flood against a capped limiter: memory has to stop growing at the cap
+        capped = SimpleRateLimiter(max_clients=num_clients // 10)
+        flood = [f"flood{i}" for i in range(num_clients)]
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for client in flood:
+            capped.hit("api", client, 100, 60)
+        flood_bytes = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        print(f"{num_clients} tracked clients")
+        print(f"bytes per client:  {per_client:.0f}")
+        print(f"per check:         {per_check * 1e9:.0f} ns")
+        print(f"flood of {num_clients} addresses, cap {capped.max_clients}: {len(capped.buckets['api'])} tracked, "
+              f"{flood_bytes / 1e6:.1f} MB (uncapped {per_client * num_clients / 1e6:.1f} MB)")
+        return {"clients": num_clients, "bytes_per_client": per_client, "check_ns": per_check * 1e9, "flood_bytes": flood_bytes}
+
+    async def run_all(self):
+        results = {}
+        results["async_db"] = await self.async_db_benchmark()
+        results["hybrid_timeline"] = await self.hybrid_timeline_benchmark()
+        results["follow_graph"] = self.follow_graph_benchmark()
+        results["suggestions"] = self.suggestions_benchmark()
+        results["suggestions_sql"] = await self.suggestions_sql_benchmark()
+        results["rate_limiter"] = self.rate_limiter_benchmark()
+        await self.async_engine.dispose()
+        return results
+
+
+async def main():
+    print("STARTING IN-PROCESS PERFORMANCE BENCHMARK")
+    benchmark = PerformanceBenchmark()
+    results = await benchmark.run_all()
+    # latency budgets are enforced: a missed target fails the run. The SQL suggestions path is
+    # reported against the same budget but not gated - the budget assumes FOLLOW_GRAPH_INDEX
+    if not results["suggestions"]["passed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,1269 @@
+import asyncio
+import os
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from database import Base
+from auth.models import User
+from post.models import Post
+from activity.models import Activity
+
+
+def make_sessionmaker():
+    """Fresh in-memory aiosqlite database with every table created"""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create_tables())
+    return async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+
+class QueryCounter:
+    """Counts SQL statements sent through an async session's engine"""
+    def __init__(self, SessionLocal):
+        self.engine = SessionLocal.kw["bind"].sync_engine
+        self.statements = []
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self.record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self.record)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+async def add_users(db, *usernames):
+    users = [
+        User(email=f"{name}@example.com", username=name, name=name.title(), hashed_password="x")
+        for name in usernames
+    ]
+    db.add_all(users)
+    await db.commit()
+    return users
+
+
+def test_async_post_services():
+    """Test post create/feed/like round trip on AsyncSession"""
+    print("Testing async post services...")
+    from post.schemas import PostCreate
+    from post.service import (create_post_svc, get_random_posts_svc, get_posts_from_hashtag_svc,
+                              like_post_svc, unlike_post_svc, liked_users_post_svc)
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            alice, bob = await add_users(db, "alice", "bob")
+            post = await create_post_svc(db, PostCreate(content="hello #world"), alice.id)
+            assert post.id and post.created_at
+
+            feed = await get_random_posts_svc(db, 1, 10)
+            assert [item.username for item in feed.items] == ["alice"]
+
+            tagged = await get_posts_from_hashtag_svc(db, "world")
+            assert [p.id for p in tagged.items] == [post.id]
+
+            assert await like_post_svc(db, post.id, bob.id, "bob") == (True, "Post liked successfully")
+            assert (await like_post_svc(db, post.id, bob.id, "bob"))[0] is False
+            assert [u.username for u in (await liked_users_post_svc(db, post.id)).items] == ["bob"]
+            assert await unlike_post_svc(db, post.id, bob.id) == (True, "Post unliked successfully")
+
+    asyncio.run(scenario())
+
+
+def test_async_profile_services():
+    """Test follow/unfollow and follower listings on AsyncSession"""
+    print("Testing async profile services...")
+    from profile.service import follow_svc, unfollow_svc, get_followers_svc, get_following_svc, is_following
+    from activity.service import get_activity_by_username
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            alice, bob = await add_users(db, "alice", "bob")
+            assert await follow_svc(db, "alice", "bob")
+            assert not await follow_svc(db, "alice", "bob")
+            assert await is_following(db, alice.id, bob.id)
+
+            followers = await get_followers_svc(db, bob.id)
+            assert [f.username for f in followers.items] == ["alice"]
+            following = await get_following_svc(db, alice.id)
+            assert [f.username for f in following.items] == ["bob"]
+
+            activity = await get_activity_by_username(db, "alice")
+            assert [a.followed_username for a in activity.items] == ["bob"]
+
+            assert await unfollow_svc(db, "alice", "bob")
+            assert not await is_following(db, alice.id, bob.id)
+
+    asyncio.run(scenario())
+
+
+def test_pool_stats():
+    """Test instrumented pool reports checkouts and checkout waits"""
+    print("Testing connection pool statistics...")
+    from database import InstrumentedQueuePool, pool_status
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine("sqlite://", poolclass=InstrumentedQueuePool, pool_size=2, max_overflow=1)
+    first = engine.connect()
+    second = engine.connect()
+    status = pool_status(engine.pool)
+    assert status["checked_out"] == 2
+    assert status["checkouts"] == 2
+    first.execute(text("select 1"))
+    first.close()
+    second.close()
+    status = pool_status(engine.pool)
+    assert status["checked_out"] == 0 and status["idle"] == 2
+    assert status["max_wait_ms"] >= 0
+
+
+def test_password_pool_rejects_when_saturated():
+    """Test password pool times calls and rejects once workers and queue are full"""
+    print("Testing password pool saturation...")
+    import threading
+    from password_pool import PasswordHashPool, PasswordPoolSaturated
+
+    release = threading.Event()
+
+    class SlowContext:
+        def hash(self, password):
+            release.wait(5)
+            return f"hashed:{password}"
+
+        def verify(self, password, hashed):
+            return hashed == f"hashed:{password}"
+
+    pool = PasswordHashPool(SlowContext(), max_workers=1, max_queue=1)
+
+    async def scenario():
+        first = asyncio.create_task(pool.hash("a"))
+        second = asyncio.create_task(pool.hash("b"))
+        await asyncio.sleep(0.05)
+        try:
+            await pool.hash("c")
+            raise AssertionError("third call should have been rejected")
+        except PasswordPoolSaturated:
+            pass
+        release.set()
+        assert await first == "hashed:a" and await second == "hashed:b"
+        assert await pool.verify("a", "hashed:a")
+
+    asyncio.run(scenario())
+    stats = pool.stats()
+    assert stats["rejected"] == 1
+    assert stats["hash"]["calls"] == 2 and stats["verify"]["calls"] == 1
+    pool.shutdown()
+
+
+def test_token_cache():
+    """Test decoded JWT claims are cached until the token expires"""
+    print("Testing decoded-token cache...")
+    import time
+    from auth.service import create_access_token, decode_access_token, token_cache
+    from cache import LRUCache
+
+    token_cache.clear()
+    token = asyncio.run(create_access_token("alice", 1))
+    before = token_cache.stats()
+    assert decode_access_token(token)["sub"] == "alice"
+    assert decode_access_token(token)["id"] == 1
+    after = token_cache.stats()
+    assert after["misses"] - before["misses"] == 1
+    assert after["hits"] - before["hits"] == 1
+
+    cache = LRUCache(maxsize=2)
+    cache.set("expired", 1, expires_at=time.time() - 1)
+    assert cache.get("expired") is None
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1
+
+
+def test_user_principal_cache():
+    """Test principal lookups hit the cache and follow/profile writes invalidate it"""
+    print("Testing user principal cache...")
+    from auth.schemas import UserUpdate
+    from auth.service import get_user_principal, update_user, user_cache
+    from profile.service import follow_svc
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            alice, bob = await add_users(db, "alice", "bob")
+            user_cache.clear()
+            principal = await get_user_principal(db, alice.id)
+            assert principal.username == "alice" and principal.following_count == 0
+            with QueryCounter(SessionLocal) as queries:
+                assert (await get_user_principal(db, alice.id)).id == alice.id
+            assert queries.count == 0
+
+            await follow_svc(db, "alice", "bob")
+            assert (await get_user_principal(db, alice.id)).following_count == 1
+
+            await update_user(db, alice, UserUpdate(name="Alice Liddell"))
+            assert (await get_user_principal(db, alice.id)).name == "Alice Liddell"
+
+    asyncio.run(scenario())
+
+
+def test_feed_keyset_pagination():
+    """Test feed cursors walk every post once, newest first, even with equal timestamps"""
+    print("Testing feed keyset pagination...")
+    from datetime import datetime
+    from post.service import get_random_posts_svc
+    from pagination import InvalidCursor
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            (alice,) = await add_users(db, "alice")
+            same_second = datetime(2025, 1, 1, 12, 0, 0)
+            db.add_all([Post(content=f"post {i}", author_id=alice.id, created_at=same_second) for i in range(7)])
+            await db.commit()
+
+            seen, cursor = [], None
+            while True:
+                page = await get_random_posts_svc(db, limit=3, cursor=cursor)
+                seen.extend(item.id for item in page.items)
+                cursor = page.next_cursor
+                if not cursor:
+                    break
+            assert seen == sorted(seen, reverse=True) and len(set(seen)) == 7
+
+            legacy = await get_random_posts_svc(db, page=2, limit=3)
+            assert [item.id for item in legacy.items] == seen[3:6]
+
+            try:
+                await get_random_posts_svc(db, cursor="not-a-cursor")
+                raise AssertionError("invalid cursor accepted")
+            except InvalidCursor:
+                pass
+
+    asyncio.run(scenario())
+
+
+def test_home_timeline_fan_out():
+    """Test home timeline fan-out, follow backfill, unfollow/delete pruning and trimming"""
+    print("Testing fan-out home timeline...")
+    from sqlalchemy import func, select
+    from config import settings
+    from post.models import TimelineEntry
+    from post.schemas import PostCreate
+    from post.service import create_post_svc, delete_post_svc, get_home_timeline_svc
+    from profile.service import follow_svc, unfollow_svc
+
+    SessionLocal = make_sessionmaker()
+    max_length, trim_every = settings.timeline_max_length, settings.timeline_trim_every
+    settings.timeline_max_length, settings.timeline_trim_every = 4, 1
+
+    async def home(db, user):
+        page, cursor, items = None, None, []
+        while page is None or cursor:
+            page = await get_home_timeline_svc(db, user.id, limit=2, cursor=cursor)
+            items.extend(item.content for item in page.items)
+            cursor = page.next_cursor
+        return items
+
+    async def scenario():
+        async with SessionLocal() as db:
+            alice, bob, carol = await add_users(db, "alice", "bob", "carol")
+            await create_post_svc(db, PostCreate(content="carol old"), carol.id)
+            await follow_svc(db, "alice", "bob")
+            bob_post = await create_post_svc(db, PostCreate(content="bob 1"), bob.id)
+            assert await home(db, alice) == ["bob 1"]
+            assert await home(db, bob) == ["bob 1"]
+
+            await follow_svc(db, "alice", "carol")
+            assert sorted(await home(db, alice)) == ["bob 1", "carol old"]
+
+            await unfollow_svc(db, "alice", "carol")
+            assert await home(db, alice) == ["bob 1"]
+
+            await delete_post_svc(db, bob_post.id)
+            assert await home(db, alice) == []
+
+            for i in range(6):
+                await create_post_svc(db, PostCreate(content=f"bob {i + 2}"), bob.id)
+            assert await home(db, alice) == ["bob 7", "bob 6", "bob 5", "bob 4"]
+            # the author's own timeline is capped too, not only the followers'
+            assert await home(db, bob) == ["bob 7", "bob 6", "bob 5", "bob 4"]
+
+            # an author past the celebrity threshold still has their own timeline trimmed
+            threshold = settings.celebrity_follower_threshold
+            settings.celebrity_follower_threshold = 1
+            try:
+                for i in range(6):
+                    await create_post_svc(db, PostCreate(content=f"bob {i + 8}"), bob.id)
+            finally:
+                settings.celebrity_follower_threshold = threshold
+            own = await db.scalar(select(func.count()).select_from(TimelineEntry).where(TimelineEntry.user_id == bob.id))
+            assert own == 4
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        settings.timeline_max_length, settings.timeline_trim_every = max_length, trim_every
+
+
+def test_home_timeline_pulls_high_follower_authors():
+    """Test posts from authors above the celebrity threshold are merged in at read time"""
+    print("Testing hybrid push/pull timeline...")
+    from sqlalchemy import func, select
+    from config import settings
+    from post.models import TimelineEntry
+    from post.schemas import PostCreate
+    from post.service import create_post_svc, get_home_timeline_svc
+    from post.timeline import recent_posts
+    from profile.service import follow_svc
+
+    SessionLocal = make_sessionmaker()
+    threshold = settings.celebrity_follower_threshold
+    settings.celebrity_follower_threshold = 2
+    recent_posts.authors.clear()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            alice, carol, star, dave = await add_users(db, "alice", "carol", "star", "dave")
+            await follow_svc(db, "alice", "star")
+            await follow_svc(db, "carol", "star")
+            await follow_svc(db, "alice", "dave")
+            for i in range(3):
+                await create_post_svc(db, PostCreate(content=f"star {i}"), star.id)
+                await create_post_svc(db, PostCreate(content=f"dave {i}"), dave.id)
+
+            fanned_out = await db.scalar(select(func.count()).select_from(TimelineEntry).where(TimelineEntry.author_id == star.id))
+            assert fanned_out == 3  # only star's own timeline
+
+            seen, cursor = [], None
+            while True:
+                page = await get_home_timeline_svc(db, alice.id, limit=4, cursor=cursor)
+                seen.extend(item.content for item in page.items)
+                cursor = page.next_cursor
+                if not cursor:
+                    break
+            assert seen == ["dave 2", "star 2", "dave 1", "star 1", "dave 0", "star 0"]
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        settings.celebrity_follower_threshold = threshold
+        recent_posts.authors.clear()
+
+
+def test_batched_hashtag_upsert():
+    """Test hashtags resolve in bulk, collapse duplicates and skip the database once cached"""
+    print("Testing batched hashtag upsert...")
+    import warnings
+    from sqlalchemy import select
+    from sqlalchemy.exc import SAWarning
+    from post.models import Hashtag, post_hashtags
+    from post.schemas import PostCreate
+    from post.service import create_post_svc, hashtag_ids
+
+    SessionLocal = make_sessionmaker()
+    hashtag_ids.clear()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            (alice,) = await add_users(db, "alice")
+            first = await create_post_svc(db, PostCreate(content="#a #b #a #c #b"), alice.id)
+            names = (await db.scalars(select(Hashtag.name).order_by(Hashtag.id))).all()
+            assert names == ["a", "b", "c"]
+            links = (await db.scalars(select(post_hashtags.c.hashtag_id).where(post_hashtags.c.post_id == first.id))).all()
+            assert len(links) == 3
+
+            # first sighting of a, b, c in the database - one lookup, then cached
+            with QueryCounter(SessionLocal) as counter:
+                await create_post_svc(db, PostCreate(content="#a #b #c #d"), alice.id)
+            hashtag_statements = [s for s in counter.statements if "hashtags" in s and "post_hashtags" not in s]
+            assert len(hashtag_statements) == 3  # IN lookup, insert-or-ignore for d, id lookup for d
+
+            with QueryCounter(SessionLocal) as counter:
+                await create_post_svc(db, PostCreate(content="#a #b #c again"), alice.id)
+            assert not [s for s in counter.statements if "hashtags" in s and "post_hashtags" not in s]
+            assert (await db.scalar(select(Hashtag.id).where(Hashtag.name == "d"))) is not None
+
+    # the link rows' INSERT ... SELECT must not be a cartesian product
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", SAWarning)
+        asyncio.run(scenario())
+
+
+def test_hashtag_posts_pagination():
+    """Test hashtag listings page newest first through the post_hashtags index"""
+    print("Testing hashtag post pagination...")
+    from post.schemas import PostCreate
+    from post.service import create_post_svc, get_posts_from_hashtag_svc
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            alice, bob = await add_users(db, "alice", "bob")
+            tagged = [(await create_post_svc(db, PostCreate(content=f"#paging post {i}"), (alice, bob)[i % 2].id)).id
+                      for i in range(5)]
+            await create_post_svc(db, PostCreate(content="#other post"), alice.id)
+
+            with QueryCounter(SessionLocal) as counter:
+                page = await get_posts_from_hashtag_svc(db, "paging", limit=2)
+            assert counter.count <= 2  # hashtag id (unless cached) + one page query
+            seen = [item.id for item in page.items]
+            assert [item.username for item in page.items] == ["alice", "bob"]
+            while page.next_cursor:
+                page = await get_posts_from_hashtag_svc(db, "paging", limit=2, cursor=page.next_cursor)
+                seen.extend(item.id for item in page.items)
+            assert seen == tagged[::-1]
+            assert await get_posts_from_hashtag_svc(db, "missing") is None
+
+    asyncio.run(scenario())
+
+
+def test_trending_hashtags():
+    """Test trending hashtags rank heavy hitters and forget buckets that leave the window"""
+    print("Testing trending hashtags...")
+    from post.trending import TrendingHashtags
+
+    trending = TrendingHashtags(capacity=20, refresh_seconds=0)
+    start = 1_000_000.0
+    trending.record(["python"] * 50 + ["fastapi"] * 30, now=start)
+    # 100 one-off tags churn the summary; overestimates stay below N/capacity = 9, under the heavy hitters
+    trending.record([f"tail{i}" for i in range(100)], now=start + 1)
+    assert [name for name, _ in trending.top("hour", 2, now=start + 2)] == ["python", "fastapi"]
+
+    trending.record(["rust"] * 10, now=start + 2 * 3600)
+    assert [name for name, _ in trending.top("hour", 3, now=start + 2 * 3600)] == ["rust"]
+    assert trending.top("day", 1, now=start + 2 * 3600)[0] == ("python", 50)
+    assert trending.top("day", 3, now=start + 2 * 86400) == []
+
+    from post.schemas import PostCreate
+    from post.service import create_post_svc, get_trending_hashtags_svc, trending_hashtags
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            (alice,) = await add_users(db, "alice")
+            for i in range(3):
+                await create_post_svc(db, PostCreate(content=f"#trendtest #trendtest {i}"), alice.id)
+
+            # a post that fails before commit is never counted
+            import post.service as post_service
+            fan_out_post = post_service.fan_out_post
+            async def failing_fan_out(*args):
+                raise RuntimeError("fan-out failed")
+            post_service.fan_out_post = failing_fan_out
+            try:
+                await create_post_svc(db, PostCreate(content="#trendtest #rolledback"), alice.id)
+                raise AssertionError("post creation should have failed")
+            except RuntimeError:
+                await db.rollback()
+            finally:
+                post_service.fan_out_post = fan_out_post
+
+    asyncio.run(scenario())
+    counts = dict(trending_hashtags.top("hour", trending_hashtags.windows["hour"].capacity))
+    assert counts["trendtest"] == 3 and "rolledback" not in counts
+    assert get_trending_hashtags_svc("day", 10_000).window == "day"
+
+
+def test_space_saving_bounds():
+    """Test the stream-summary space-saving keeps its error bounds and O(1) minimum under churn"""
+    print("Testing space-saving summary...")
+    import random
+    from collections import Counter
+    from post.trending import SpaceSaving
+
+    rng = random.Random(3)
+    stream = [f"tag{int(rng.paretovariate(1.0))}" for _ in range(20000)]
+    summary = SpaceSaving(50)
+    for name in stream:
+        summary.add(name)
+    true = Counter(stream)
+    assert len(summary.counts) == 50 and sum(summary.counts.values()) == len(stream)
+    # every tracked count brackets the true count, and the minimum is where the buckets say it is
+    for name, count in summary.counts.items():
+        assert count - summary.errors[name] <= true[name] <= count
+    assert summary.min_count == min(summary.counts.values())
+    assert {name: count for count, names in summary.by_count.items() for name in names} == summary.counts
+    # anything more frequent than N/capacity is guaranteed to be tracked
+    assert all(name in summary.counts for name, count in true.items() if count > len(stream) / 50)
+
+
+def test_like_cost_is_flat():
+    """Test like/unlike issue the same statements no matter how many likes a post has"""
+    print("Testing constant-time likes...")
+    import re
+    from sqlalchemy import insert, select
+    from post.models import post_likes
+    from post.schemas import PostCreate
+    from post.service import create_post_svc, like_post_svc, unlike_post_svc
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            alice, bob, carol = await add_users(db, "alice", "bob", "carol")
+            quiet = await create_post_svc(db, PostCreate(content="quiet"), alice.id)
+            viral = await create_post_svc(db, PostCreate(content="viral"), alice.id)
+            fans = await add_users(db, *[f"fan{i}" for i in range(500)])
+            await db.execute(insert(post_likes), [{"user_id": fan.id, "post_id": viral.id} for fan in fans])
+            await db.execute(Post.__table__.update().where(Post.id == viral.id).values(likes_count=len(fans)))
+            await db.commit()
+
+            counts = []
+            for post in (quiet, viral):
+                with QueryCounter(SessionLocal) as counter:
+                    assert (await like_post_svc(db, post.id, bob.id, "bob"))[0]
+                    assert await like_post_svc(db, post.id, bob.id, "bob") == (False, "already liked")
+                    assert (await unlike_post_svc(db, post.id, bob.id))[0]
+                    assert await unlike_post_svc(db, post.id, bob.id) == (False, "already not liked")
+                counts.append(counter.count)
+            assert counts[0] == counts[1]
+            # the caller's principal supplies the liker, so no user row is read
+            assert not [s for s in counter.statements if re.search(r"FROM \"?user\"?\s", s)], counter.statements
+
+            assert (await like_post_svc(db, viral.id, carol.id, "carol"))[0]
+            likes = await db.scalar(select(Post.likes_count).where(Post.id == viral.id))
+            assert likes == len(fans) + 1
+
+    asyncio.run(scenario())
+
+
+def test_like_write_behind():
+    """Test write-behind likes show up on reads at once and land in one batched UPDATE"""
+    print("Testing write-behind like counters...")
+    from sqlalchemy import select
+    from config import settings
+    from post.schemas import PostCreate
+    from post.service import create_post_svc, get_post_svc, like_post_svc, unlike_post_svc, like_counters
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            users = await add_users(db, "alice", *[f"fan{i}" for i in range(5)])
+            first = await create_post_svc(db, PostCreate(content="first"), users[0].id)
+            second = await create_post_svc(db, PostCreate(content="second"), users[0].id)
+            first, second = first.id, second.id
+            fan_ids = {user.username: user.id for user in users[1:]}
+            for name, fan_id in fan_ids.items():
+                assert (await like_post_svc(db, first, fan_id, name))[0]
+            assert (await like_post_svc(db, second, fan_ids["fan0"], "fan0"))[0]
+            assert (await unlike_post_svc(db, first, fan_ids["fan4"]))[0]
+
+            assert await db.scalar(select(Post.likes_count).where(Post.id == first)) == 0
+            assert (await get_post_svc(db, first))["likes_count"] == 4
+
+            with QueryCounter(SessionLocal) as counter:
+                assert await like_counters.flush(SessionLocal) == 2
+            assert len([s for s in counter.statements if s.startswith("UPDATE")]) == 1
+            assert like_counters.pending == {} and like_counters.delta(first) == 0
+            db.expire_all()
+            assert await db.scalar(select(Post.likes_count).where(Post.id == first)) == 4
+            assert (await get_post_svc(db, second))["likes_count"] == 1
+
+            # shutdown drains whatever the background task has not flushed yet
+            like_counters.start(SessionLocal)
+            assert (await like_post_svc(db, second, fan_ids["fan1"], "fan1"))[0]
+            await like_counters.stop(SessionLocal)
+            assert await db.scalar(select(Post.likes_count).where(Post.id == second)) == 2
+
+            # stopping while a flush is mid-commit lets it finish instead of dropping its deltas
+            committing, release = asyncio.Event(), asyncio.Event()
+
+            class SlowCommit:
+                def __init__(self):
+                    self.session = SessionLocal()
+
+                async def __aenter__(self):
+                    db = await self.session.__aenter__()
+                    commit = db.commit
+
+                    async def slow_commit():
+                        committing.set()
+                        await release.wait()
+                        await commit()
+                    db.commit = slow_commit
+                    return db
+
+                async def __aexit__(self, *exc):
+                    return await self.session.__aexit__(*exc)
+
+            like_counters.start(SlowCommit)
+            assert (await like_post_svc(db, second, fan_ids["fan2"], "fan2"))[0]
+            await committing.wait()
+            stopping = asyncio.create_task(like_counters.stop(SessionLocal))
+            await asyncio.sleep(0)
+            release.set()
+            await stopping
+            assert like_counters.pending == {} and like_counters.in_flight == {}
+            db.expire_all()
+            assert await db.scalar(select(Post.likes_count).where(Post.id == second)) == 3
+
+    settings.like_write_behind = True
+    try:
+        asyncio.run(scenario())
+    finally:
+        settings.like_write_behind = False
+        like_counters.pending.clear()
+
+
+def test_list_endpoints_share_cursor_pagination():
+    """Test every list service pages through {items, next_cursor} and caps the page size"""
+    print("Testing uniform cursor pagination...")
+    from config import settings
+    from post.schemas import PostCreate
+    from post.service import create_post_svc, get_user_posts_svc, like_post_svc, liked_users_post_svc
+    from profile.service import follow_svc, get_followers_svc, get_following_svc
+    from activity.service import get_activity_by_username
+
+    SessionLocal = make_sessionmaker()
+
+    async def walk(fetch, key):
+        seen, cursor = [], None
+        while True:
+            page = await fetch(limit=2, cursor=cursor)
+            assert len(page.items) <= 2
+            seen.extend(key(item) for item in page.items)
+            cursor = page.next_cursor
+            if not cursor:
+                return seen
+
+    async def scenario():
+        async with SessionLocal() as db:
+            users = await add_users(db, "alice", *[f"user{i}" for i in range(5)])
+            names = [user.username for user in users[1:]]
+            posts = [(await create_post_svc(db, PostCreate(content=f"post {i}"), users[0].id)).id for i in range(5)]
+            for user in users[1:]:
+                assert await follow_svc(db, user.username, "alice")
+                assert await follow_svc(db, "alice", user.username)
+                assert (await like_post_svc(db, posts[0], user.id, user.username))[0]
+            alice_id = users[0].id
+
+            assert await walk(lambda **kw: get_user_posts_svc(db, alice_id, **kw), lambda p: p.id) == posts[::-1]
+            assert sorted(await walk(lambda **kw: liked_users_post_svc(db, posts[0], **kw), lambda u: u.username)) == names
+            assert sorted(await walk(lambda **kw: get_followers_svc(db, alice_id, **kw), lambda u: u.username)) == names
+            assert sorted(await walk(lambda **kw: get_following_svc(db, alice_id, **kw), lambda u: u.username)) == names
+            # alice's stream holds her follows, newest first, and one aggregate row for the likes on her post
+            activity = await walk(lambda **kw: get_activity_by_username(db, "alice", **kw), lambda a: a)
+            assert [a.followed_username for a in activity if a.type == "follow"] == names[::-1]
+            [likes] = [a for a in activity if a.type == "like"]
+            assert likes.like_count == len(names) and likes.username_liked == names[-1]
+
+            max_page_size = settings.max_page_size
+            settings.max_page_size = 3
+            try:
+                assert len((await get_user_posts_svc(db, alice_id, limit=1000)).items) == 3
+            finally:
+                settings.max_page_size = max_page_size
+
+    asyncio.run(scenario())
+
+
+def test_follow_listings_are_one_query():
+    """Test follower/following pages cost a single query however many rows they hold (no N+1)"""
+    print("Testing follow listings query count...")
+    from profile.service import follow_svc, get_followers_svc, get_following_svc
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            users = await add_users(db, "alice", *[f"user{i}" for i in range(12)])
+            for user in users[1:]:
+                assert await follow_svc(db, user.username, "alice")
+                assert await follow_svc(db, "alice", user.username)
+            alice_id = users[0].id
+            db.expunge_all()
+
+            for listing in (get_followers_svc, get_following_svc):
+                with QueryCounter(SessionLocal) as counter:
+                    page = await listing(db, alice_id, limit=10)
+                assert len(page.items) == 10 and page.next_cursor
+                assert counter.count == 1, counter.statements
+                assert page.items[0].username == "user11" and page.items[0].name == "User11"
+
+    asyncio.run(scenario())
+
+
+def test_follow_lists_by_username_require_login():
+    """Test the by-username follow lists answer 401, not a server error, when the token is invalid"""
+    print("Testing follow list auth guard...")
+    from fastapi import HTTPException
+    from profile.views import get_followers_by_username, get_following_by_username
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            await add_users(db, "alice")
+            for view in (get_following_by_username, get_followers_by_username):
+                try:
+                    await view("alice", limit=10, cursor=None, _=True, current_user=None, db=db)
+                    raise AssertionError(f"{view.__name__} allowed an anonymous caller")
+                except HTTPException as e:
+                    assert e.status_code == 401
+
+    asyncio.run(scenario())
+
+def test_follow_graph_index():
+    """Test the in-memory follow graph loads from the table, stays in sync and answers without SQL"""
+    print("Testing follow graph index...")
+    from sqlalchemy import insert
+    from auth.models import Follow
+    from profile.graph import follow_graph
+    from profile.service import follow_svc, unfollow_svc, is_following
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            alice, bob, carol = await add_users(db, "alice", "bob", "carol")
+            assert await follow_svc(db, "alice", "carol")
+            assert await follow_svc(db, "bob", "alice")
+            await follow_graph.load(db)
+            assert follow_graph.edges == 2
+
+            assert await follow_svc(db, "alice", "bob")
+            assert await unfollow_svc(db, "alice", "carol")
+            with QueryCounter(SessionLocal) as counter:
+                assert await is_following(db, alice.id, bob.id)
+                assert await is_following(db, bob.id, alice.id)
+            assert counter.count == 0
+            assert follow_graph.stats()["edges"] == 2
+
+            # "not following" is confirmed against the table - another worker may have written the follow
+            with QueryCounter(SessionLocal) as counter:
+                assert not await is_following(db, alice.id, carol.id)
+            assert counter.count == 1
+            await db.execute(insert(Follow).values(follower_id=carol.id, following_id=bob.id))
+            await db.commit()
+            assert await is_following(db, carol.id, bob.id)
+            assert follow_graph.follows(carol.id, bob.id)
+
+            # ids past 2**31 fit the adjacency arrays
+            follow_graph.add(alice.id, 2**40)
+            assert follow_graph.follows(alice.id, 2**40)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        follow_graph.__init__()
+
+
+def test_suggestions_rank_mutual_connections():
+    """Test suggestions rank friends-of-friends by mutual count on both graph paths and refresh on follow"""
+    print("Testing follow suggestions...")
+    import random
+    from profile.graph import follow_graph
+    from profile.service import follow_svc, get_suggestions_svc, suggestion_cache
+    from profile.suggestions import rank_friends_of_friends
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            await add_users(db, "alice", "bob", "carol", "dave", "erin", "frank")
+            for follower, following in [("alice", "bob"), ("alice", "carol"), ("bob", "dave"), ("carol", "dave"),
+                                        ("bob", "erin"), ("carol", "alice"), ("dave", "frank")]:
+                assert await follow_svc(db, follower, following)
+            alice_id = 1
+
+            expected = [("dave", 2), ("erin", 1)]
+            suggestions = await get_suggestions_svc(db, alice_id)
+            assert [(s["username"], s["mutual_count"]) for s in suggestions] == expected
+            await follow_graph.load(db)
+            suggestion_cache.clear()
+            assert [(s["username"], s["mutual_count"]) for s in await get_suggestions_svc(db, alice_id)] == expected
+
+            assert await follow_svc(db, "alice", "dave")
+            assert [s["username"] for s in await get_suggestions_svc(db, alice_id)] == ["erin", "frank"]
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        follow_graph.__init__()
+        suggestion_cache.clear()
+
+    # the database path above the friend sampling threshold: 100 friends all following one account
+    from sqlalchemy import insert, update
+    from auth.models import Follow
+    from config import settings
+    saved = settings.suggestions_max_friends, settings.suggestions_max_per_friend
+    settings.suggestions_max_friends, settings.suggestions_max_per_friend = 20, 5
+    SessionLocal = make_sessionmaker()
+
+    async def sampled_scenario():
+        async with SessionLocal() as db:
+            users = await add_users(db, "me", "star", *[f"friend{i}" for i in range(100)], *[f"other{j}" for j in range(10)])
+            me, star, friends, others = users[0].id, users[1].id, [u.id for u in users[2:102]], [u.id for u in users[102:]]
+
+            async def add_follows(pairs):
+                await db.execute(insert(Follow), [{"follower_id": a, "following_id": b} for a, b in pairs])
+                for follower_id in {a for a, _ in pairs}:
+                    await db.execute(update(User).where(User.id == follower_id)
+                                     .values(following_count=User.following_count + sum(a == follower_id for a, _ in pairs)))
+                await db.commit()
+
+            await add_follows([(me, friend) for friend in friends] + [(friend, star) for friend in friends])
+            me_id = me
+            for _ in range(5):
+                suggestion_cache.clear()
+                assert [(s["username"], s["mutual_count"]) for s in await get_suggestions_svc(db, me_id)] == [("star", 100)]
+
+            # past the per-friend cap each sampled friend's scan stops at its own LIMIT
+            await add_follows([(friend, other) for friend in friends for other in others])
+            suggestion_cache.clear()
+            with QueryCounter(SessionLocal) as counter:
+                suggestions = await get_suggestions_svc(db, me_id)
+            [edges] = [s for s in counter.statements if "FROM follow" in s and "UNION ALL" in s]
+            assert edges.count("LIMIT") == 20
+            # 11 follows per friend, scaled back up from the 5 read: the estimates keep the true total
+            assert sum(s["mutual_count"] for s in suggestions) == 100 * 11
+
+    try:
+        asyncio.run(sampled_scenario())
+    finally:
+        settings.suggestions_max_friends, settings.suggestions_max_per_friend = saved
+        suggestion_cache.clear()
+
+    # sampling keeps the heavy hitter on top and its estimate close to the true mutual count
+    following = list(range(2, 1002))
+    adjacency = lambda friend_id: [5000] + list(range(10000 + friend_id * 10, 10000 + friend_id * 10 + 5))
+    top = rank_friends_of_friends(1, following, adjacency, 3, 100, 200, random.Random(1))
+    assert top[0] == (5000, 1000)
+
+
+def test_bulk_relationships():
+    """Test relationship flags for many users come back from one query per direction"""
+    print("Testing bulk relationship status...")
+    from profile.service import follow_svc, get_relationships_svc
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            users = await add_users(db, "alice", "bob", "carol", "dave", *[f"user{i}" for i in range(50)])
+            assert await follow_svc(db, "alice", "bob")
+            assert await follow_svc(db, "bob", "alice")
+            assert await follow_svc(db, "carol", "alice")
+            assert await follow_svc(db, "alice", "dave")
+
+            names = ["bob", "carol", "dave", "nobody", "bob"] + [f"user{i}" for i in range(50)]
+            with QueryCounter(SessionLocal) as counter:
+                result = await get_relationships_svc(db, users[0].id, names)
+            assert counter.count == 2
+            flags = {r.username: (r.following, r.followed_by) for r in result.relationships}
+            assert len(result.relationships) == 54
+            assert flags["bob"] == (True, True)
+            assert flags["carol"] == (False, True)
+            assert flags["dave"] == (True, False)
+            assert flags["nobody"] == flags["user0"] == (False, False)
+
+    asyncio.run(scenario())
+
+
+def test_liked_by_me_flags():
+    """Test feed, hashtag and user-post pages flag the viewer's likes with one extra query"""
+    print("Testing liked_by_me flags...")
+    from post.schemas import PostCreate
+    from post.service import (create_post_svc, like_post_svc, get_random_posts_svc,
+                              get_posts_from_hashtag_svc, get_user_posts_svc)
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            alice, bob = await add_users(db, "alice", "bob")
+            posts = [(await create_post_svc(db, PostCreate(content=f"#flag post {i}"), alice.id)).id for i in range(4)]
+            for post_id in posts[::2]:
+                assert (await like_post_svc(db, post_id, bob.id, "bob"))[0]
+            liked = {post_id: post_id in posts[::2] for post_id in posts}
+
+            pages = {
+                "feed": lambda viewer: get_random_posts_svc(db, limit=10, viewer_id=viewer),
+                "hashtag": lambda viewer: get_posts_from_hashtag_svc(db, "flag", limit=10, viewer_id=viewer),
+                "user": lambda viewer: get_user_posts_svc(db, alice.id, limit=10, viewer_id=viewer),
+            }
+            for name, fetch in pages.items():
+                anonymous = await fetch(None)
+                assert all(item.liked_by_me is None for item in anonymous.items), name
+                with QueryCounter(SessionLocal) as anonymous_counter:
+                    await fetch(None)
+                with QueryCounter(SessionLocal) as counter:
+                    page = await fetch(bob.id)
+                assert counter.count == anonymous_counter.count + 1, name
+                assert {item.id: item.liked_by_me for item in page.items} == liked, name
+
+    asyncio.run(scenario())
+
+
+def test_activity_stream_index_scan():
+    """Test the activity page is a range scan of the (username, timestamp DESC, id) index"""
+    print("Testing activity stream index...")
+    from sqlalchemy import text
+    from sqlalchemy.dialects import sqlite
+    from activity.service import get_activity_by_username
+    from profile.service import follow_svc
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            await add_users(db, "alice", "bob", "carol")
+            assert await follow_svc(db, "alice", "bob")
+            assert await follow_svc(db, "alice", "carol")
+            page = await get_activity_by_username(db, "alice", limit=1)
+            assert [(item.type, item.followed_username) for item in page.items] == [("follow", "carol")]
+            assert not hasattr(page.items[0], "username")
+
+            with QueryCounter(SessionLocal) as counter:
+                await get_activity_by_username(db, "alice", limit=1, cursor=page.next_cursor)
+            compiled = counter.statements[0].replace("?", "'alice'", 1).replace("?", "'2025-01-01 00:00:00'", 3).replace("?", "1")
+            plan = " ".join(str(row) for row in await db.execute(text("EXPLAIN QUERY PLAN " + compiled)))
+            assert "ix_activity_username_timestamp_id" in plan and "TEMP B-TREE" not in plan, plan
+
+    asyncio.run(scenario())
+
+
+def test_activity_writer_batches_and_drains():
+    """Test queued activity is bulk-inserted in batches, drained on stop, and a full queue pushes back"""
+    print("Testing background activity writer...")
+    from sqlalchemy import func, select
+    from activity.writer import ActivityWriter
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        writer = ActivityWriter(max_queue=100, batch_size=50, interval_ms=10_000)
+        writer.start(SessionLocal)
+        with QueryCounter(SessionLocal) as counter:
+            for i in range(120):
+                await writer.enqueue({"username": "alice", "followed_username": f"user{i}"})
+            await writer.stop()
+        inserts = [s for s in counter.statements if s.startswith("INSERT INTO activity")]
+        assert len(inserts) == 3  # 50 + 50 on size, the last 20 drained by stop()
+        assert writer.stats()["written"] == 120 and not writer.running
+        async with SessionLocal() as db:
+            assert await db.scalar(select(func.count(Activity.id))) == 120
+
+        # nobody consuming: the third event waits out the timeout and is dropped
+        stalled = ActivityWriter(max_queue=2, enqueue_timeout_ms=10)
+        stalled.queue = asyncio.Queue(maxsize=2)
+        for i in range(3):
+            await stalled.enqueue({"username": "alice"})
+        assert stalled.dropped == 1
+
+    asyncio.run(scenario())
+
+
+def test_like_activity_coalesces():
+    """Test likes on one post within a bucket share a row holding the count and the newest likers"""
+    print("Testing coalesced like activity...")
+    from sqlalchemy import func, select
+    from activity.writer import ActivityWriter, record_activity, write_activity
+    from activity.service import get_activity_by_username
+    SessionLocal = make_sessionmaker()
+
+    def like(i, post_id=1, bucket=7):
+        return {"username": "alice", "liked_post_id": post_id, "username_liked": f"user{i}", "bucket": bucket}
+
+    async def scenario():
+        async with SessionLocal() as db:
+            # a hot post: 5000 likes across batches, still one row
+            with QueryCounter(SessionLocal) as counter:
+                for start in range(0, 5000, 500):
+                    await write_activity(db, [like(i) for i in range(start, start + 500)])
+                await db.commit()
+            assert len(counter.statements) == 10 * 3  # seed, read likers, update - per batch, not per like
+            [row] = (await db.execute(select(Activity))).scalars().all()
+            assert row.like_count == 5000 and row.recent_likers == "user4999,user4998,user4997"
+
+            # another bucket or another post starts its own row
+            await write_activity(db, [like(0, bucket=8), like(1, post_id=2), like(2, post_id=2)])
+            await db.commit()
+            assert await db.scalar(select(func.count(Activity.id))) == 3
+
+            page = await get_activity_by_username(db, "alice", limit=10)
+            hot, *_ = [item for item in page.items if item.like_count == 5000]
+            assert hot.message == "user4999 and 4,999 others liked your post"
+            assert hot.recent_likers == ["user4999", "user4998", "user4997"]
+            [pair] = [item for item in page.items if item.liked_post_id == 2]
+            assert pair.message == "user2 and 1 other liked your post"
+
+            # the request path stamps the bucket itself, and the background writer coalesces the same way
+            await record_activity(db, username="bob", liked_post_id=3, username_liked="carol")
+            bucket = await db.scalar(select(Activity.bucket).where(Activity.liked_post_id == 3))
+            writer = ActivityWriter(batch_size=100, interval_ms=10)
+            writer.start(SessionLocal)
+            for i in range(3):
+                await writer.enqueue({**like(i, post_id=3, bucket=bucket), "username": "bob"})
+            await writer.stop()
+            async with SessionLocal() as fresh:
+                [item] = (await get_activity_by_username(fresh, "bob")).items
+            assert item.like_count == 4 and item.message == "user2 and 3 others liked your post"
+
+    asyncio.run(scenario())
+    print("Coalesced like activity tests passed")
+
+
+def test_activity_retention_rolls_up_and_deletes():
+    """Test expired activity is summarised per user and day, deleted in batches, and fresh rows are kept"""
+    print("Testing activity retention...")
+    from datetime import datetime, timedelta
+    from sqlalchemy import func, select
+    from activity.models import ActivityDailySummary
+    from activity.retention import ActivityRetention
+    SessionLocal = make_sessionmaker()
+    now = datetime(2024, 6, 30, 12)
+
+    async def scenario():
+        async with SessionLocal() as db:
+            old = now - timedelta(days=40)
+            db.add_all([Activity(username="alice", followed_username=f"user{i}", timestamp=old + timedelta(minutes=i)) for i in range(25)])
+            db.add_all([
+                Activity(username="alice", liked_post_id=1, username_liked="bob", bucket=1, like_count=7, timestamp=old),
+                Activity(username="alice", liked_post_id=2, username_liked="bob", bucket=1, like_count=3, timestamp=old - timedelta(days=1)),
+                Activity(username="alice", liked_post_id=3, username_liked="bob", bucket=2, like_count=1, timestamp=now - timedelta(days=5)),
+                Activity(username="carol", followed_username="alice", timestamp=now - timedelta(days=5)),
+            ])
+            await db.commit()
+
+        retention = ActivityRetention({"like": 30, "follow": 30}, batch_size=10, pause_ms=0)
+        with QueryCounter(SessionLocal) as counter:
+            deleted = await retention.run_once(SessionLocal, now=now)
+        assert deleted == {"like": 2, "follow": 25}
+        # the deletes are batched: 3 follow batches and 1 like batch, never one per row
+        assert sum(s.startswith("DELETE FROM activity") for s in counter.statements) == 4
+        stats = retention.stats()
+        assert stats["batches"] == 4 and stats["deleted"] == {"like": 2, "follow": 25} and stats["in_progress"] is None
+
+        async with SessionLocal() as db:
+            kept = (await db.execute(select(Activity.username, Activity.liked_post_id).order_by(Activity.username))).all()
+            assert [tuple(row) for row in kept] == [("alice", 3), ("carol", None)]
+            summaries = {(s.username, s.day, s.type): s.count for s in (await db.execute(select(ActivityDailySummary))).scalars()}
+        old_day = (now - timedelta(days=40)).date()
+        assert summaries == {
+            ("alice", old_day, "follow"): 25,
+            ("alice", old_day, "like"): 7,
+            ("alice", old_day - timedelta(days=1), "like"): 3,
+        }
+
+        # a later pass adds onto existing summary rows; a zero TTL keeps that type forever
+        async with SessionLocal() as db:
+            db.add(Activity(username="alice", followed_username="dave", timestamp=now - timedelta(days=40)))
+            db.add(Activity(username="alice", liked_post_id=4, username_liked="bob", bucket=3, timestamp=now - timedelta(days=40)))
+            await db.commit()
+        assert await ActivityRetention({"like": 0, "follow": 30}).run_once(SessionLocal, now=now) == {"follow": 1}
+        async with SessionLocal() as db:
+            follows = await db.scalar(select(ActivityDailySummary.count).where(ActivityDailySummary.type == "follow"))
+            assert follows == 26 and await db.scalar(select(Activity.id).where(Activity.liked_post_id == 4))
+
+        # rows kept by a longer TTL sit between the expired ones; each batch resumes past the last row it
+        # handled instead of walking those survivors again from the oldest entry
+        async with SessionLocal() as db:
+            await db.execute(Activity.__table__.delete())
+            old = now - timedelta(days=100)
+            for i in range(30):
+                db.add(Activity(username="erin", followed_username=f"user{i}", timestamp=old + timedelta(minutes=2 * i)))
+                db.add(Activity(username="erin", liked_post_id=100 + i, username_liked="bob", bucket=i, timestamp=old + timedelta(minutes=2 * i + 1)))
+            await db.commit()
+        with QueryCounter(SessionLocal) as counter:
+            deleted = await ActivityRetention({"like": 90, "follow": 365}, batch_size=10, pause_ms=0).run_once(SessionLocal, now=now)
+        assert deleted == {"like": 30, "follow": 0}
+        batches = [s for s in counter.statements if s.startswith("SELECT activity.id") and "liked_post_id IS NOT NULL" in s]
+        assert len(batches) == 4 and "activity.timestamp >" not in batches[0]
+        assert all("activity.timestamp >" in s for s in batches[1:])
+        async with SessionLocal() as db:
+            assert await db.scalar(select(func.count(Activity.id)).where(Activity.username == "erin")) == 30
+
+    asyncio.run(scenario())
+    print("Activity retention tests passed")
+
+
+def test_activity_retention_skips_rows_another_worker_took():
+    """Test a batch partly deleted by another worker's pass is re-selected, not rolled up twice"""
+    print("Testing activity retention across workers...")
+    import sqlite3
+    import tempfile
+    from datetime import datetime, timedelta
+    from sqlalchemy import select
+    from activity.models import ActivityDailySummary
+    from activity.retention import ActivityRetention
+
+    # a file database, so the other worker can commit on its own connection mid-batch
+    path = os.path.join(tempfile.mkdtemp(), "retention.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    now = datetime(2024, 6, 30, 12)
+    taken = []
+
+    def other_worker(conn, cursor, statement, parameters, context, executemany):
+        # between this pass's SELECT and its DELETE, another pass deletes (and rolls up) one row
+        if statement.startswith("DELETE FROM activity") and not taken:
+            other = sqlite3.connect(path)
+            taken.append(other.execute("SELECT MIN(id) FROM activity").fetchone()[0])
+            other.execute("DELETE FROM activity WHERE id = ?", taken)
+            other.commit()
+            other.close()
+
+    async def scenario():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with SessionLocal() as db:
+            old = now - timedelta(days=40)
+            db.add_all([Activity(username="alice", followed_username=f"user{i}", timestamp=old + timedelta(minutes=i)) for i in range(5)])
+            await db.commit()
+
+        retention = ActivityRetention({"follow": 30}, batch_size=10, pause_ms=0)
+        event.listen(engine.sync_engine, "before_cursor_execute", other_worker)
+        try:
+            assert await retention.run_once(SessionLocal, now=now) == {"follow": 4}
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", other_worker)
+        assert retention.stats()["conflicts"] == 1
+        async with SessionLocal() as db:
+            assert (await db.execute(select(Activity))).first() is None
+            assert await db.scalar(select(ActivityDailySummary.count)) == 4
+        await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_rate_limit_buckets_per_tier():
+    """Test each tier keeps its own bucket per client, so a strict tier cannot shrink a looser one"""
+    print("Testing per-tier rate limit buckets...")
+    from fastapi import HTTPException
+    from starlette.requests import Request
+    from rate_limiter import SimpleRateLimiter, TokenBucket
+
+    limiter = SimpleRateLimiter()
+    request = Request({"type": "http", "headers": [], "client": ("10.0.0.1", 1234)})
+
+    async def scenario():
+        # the auth tier touches the client first; the api tier still gets its full 100
+        for _ in range(5):
+            await limiter.check_rate_limit(request, max_requests=5, window_seconds=60, tier="auth")
+        for _ in range(100):
+            await limiter.check_rate_limit(request, max_requests=100, window_seconds=60, tier="api")
+        for tier, limit in [("auth", 5), ("api", 100)]:
+            try:
+                await limiter.check_rate_limit(request, max_requests=limit, window_seconds=60, tier=tier)
+                raise AssertionError(f"{tier} tier was not limited")
+            except HTTPException as e:
+                assert e.status_code == 429
+        assert {tier: list(clients) for tier, clients in limiter.buckets.items()} == {"auth": ["10.0.0.1"], "api": ["10.0.0.1"]}
+        assert limiter.buckets["api"]["10.0.0.1"].capacity == 100
+
+        # calls without a tier are keyed by their limits rather than sharing one bucket
+        await limiter.check_rate_limit(request, max_requests=30, window_seconds=60)
+        assert "10.0.0.1" in limiter.buckets["30/60"]
+
+    asyncio.run(scenario())
+    assert not hasattr(TokenBucket(1, 1), "__dict__")
+    print("Per-tier rate limit bucket tests passed")
+
+
+def test_rate_limiter_memory_cap():
+    """Test spoofed forwarding headers are ignored and a flood of new clients cannot grow the limiter past its cap"""
+    print("Testing rate limiter memory cap...")
+    import time
+    from starlette.requests import Request
+    from rate_limiter import SimpleRateLimiter
+
+    def request(peer, forwarded=None):
+        headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+        return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+    limiter = SimpleRateLimiter(max_clients=100, sketch_width=512, sketch_depth=4, trusted_proxies=["10.0.0.0/8"])
+    # a direct client cannot pick its own address; behind our proxies the nearest untrusted hop counts
+    assert limiter.get_client_ip(request("203.0.113.5", "1.2.3.4")) == "203.0.113.5"
+    assert limiter.get_client_ip(request("10.0.0.2", "1.2.3.4, 198.51.100.7, 10.0.0.9")) == "198.51.100.7"
+    assert limiter.get_client_ip(request("10.0.0.2")) == "10.0.0.2"
+
+    assert limiter.hit("api", "regular", 5, 60) is None
+    for i in range(10000):
+        limiter.hit("api", f"spoofed{i}", 5, 60)
+    # the table stops at the cap and the busy client was not evicted by the flood
+    assert len(limiter.buckets["api"]) == 100 and "regular" in limiter.buckets["api"]
+    assert limiter.stats()["sketch_checks"] == 10000 - 99 and limiter.evictions == 0
+
+    # past the cap one address is still limited, by its count-min estimate
+    results = [limiter.hit("api", "repeat", 5, 60) for _ in range(50)]
+    assert results[-1] is not None and limiter.sketch_limited > 0
+
+    # a bucket idle long enough to be full again is evicted in LRU order to make room
+    oldest_name, oldest = next(iter(limiter.buckets["api"].items()))
+    oldest.last_refill = time.monotonic() - 60
+    assert limiter.hit("api", "newcomer", 5, 60) is None
+    assert "newcomer" in limiter.buckets["api"] and oldest_name not in limiter.buckets["api"] and limiter.evictions == 1
+    print("Rate limiter memory cap tests passed")
+
+
+def test_metrics_internal_only():
+    """Test /metrics answers only allowlisted peers, whatever forwarding headers claim"""
+    print("Testing metrics allowlist...")
+    from fastapi import HTTPException
+    from starlette.requests import Request
+    from main import internal_only
+    from rate_limiter import rate_limiter
+
+    def request(peer, forwarded=None):
+        headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+        return Request({"type": "http", "headers": headers, "client": (peer, 1234) if peer else None})
+
+    async def scenario():
+        assert await internal_only(request("127.0.0.1"))
+        for peer, forwarded in [("203.0.113.9", None), ("203.0.113.9", "127.0.0.1"), ("testclient", None), (None, None)]:
+            try:
+                await internal_only(request(peer, forwarded))
+                raise AssertionError(f"{peer} reached /metrics")
+            except HTTPException as e:
+                assert e.status_code == 403
+
+    asyncio.run(scenario())
+    assert "trusted_proxies" not in rate_limiter.stats()
+
+
+def test_update_profile_requires_login():
+    """Test an invalid token on profile update is a 401, not a server error"""
+    print("Testing profile update auth guard...")
+    from fastapi import HTTPException
+    from starlette.requests import Request
+    from auth.schemas import UserUpdate
+    from auth.views import update_user
+
+    SessionLocal = make_sessionmaker()
+
+    async def scenario():
+        async with SessionLocal() as db:
+            request = Request({"type": "http", "headers": [], "client": ("127.0.0.1", 1234)})
+            try:
+                await update_user(request, UserUpdate(name="Alice"), _=True, principal=None, db=db)
+                raise AssertionError("anonymous profile update was accepted")
+            except HTTPException as e:
+                assert e.status_code == 401
+
+    asyncio.run(scenario())